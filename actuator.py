@@ -0,0 +1,172 @@
+# 水門モーターの駆動
+# 動作は専用タスク (run) が行い、呼び出し側は目標の開度を渡すだけで待たない
+# 位置はリミットスイッチが無いため、全開・全閉にかかる時間と駆動時間から推定する (0.0 閉 - 1.0 開)
+# 動作中に新しい目標が来ればその場で止めて向きを変える (逆転前に reverse_ms 止める)
+# 全開・全閉へ向かう時は全行程の overtravel 分だけ長く回して推定の誤差を端で吸収できる (既定は 0: 設定どおりの時間)
+
+import uasyncio as asyncio
+import utime
+
+OPENING = 1
+CLOSING = -1
+
+
+class Actuator:
+    def __init__(self, m1, m2, open_sec=20, close_sec=40, settle_ms=5000, reverse_ms=500, overtravel=0.0, position=1.0):
+        self._m1 = m1
+        self._m2 = m2
+        self.open_ms = open_sec * 1000
+        self.close_ms = close_sec * 1000
+        self.settle_ms = settle_ms  # 停止から次の始動までの間隔
+        self.reverse_ms = reverse_ms  # 動作中に逆転する時の停止時間
+        self.overtravel = overtravel  # 全行程に対する割合
+        self.position = position  # 推定位置 (起動時は不明なので全開とみなし、最初の閉で全行程回す)
+        self.target = position
+        self.direction = 0
+        self._since = utime.ticks_ms()  # 位置を最後に更新した時刻
+        self._stopped = utime.ticks_add(self._since, -settle_ms)
+        self._wake = asyncio.ThreadSafeFlag()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.on_ms_open = 0  # 開方向の累計駆動時間
+        self.on_ms_close = 0
+        self.starts = 0
+        self.reversals = 0
+        self.preempts = 0  # 動作中に目標が変わった回数
+        self._stamp = None  # 目標を出した入力の ticks_ms (始動時に通知する)
+        self._subs = []
+
+    def configure(self, open_sec, close_sec, overtravel=0.0):
+        self.open_ms = open_sec * 1000
+        self.close_ms = close_sec * 1000
+        self.overtravel = overtravel
+
+    # 目標へ向けてモーターが回り始めた時に callback(向き, stamp) を呼ぶ (stamp 付きの move_to のみ)
+    def subscribe(self, callback):
+        self._subs.append(callback)
+
+    # 止まっている時に推定位置を設定する (保存しておいた位置の復元用)
+    def restore(self, position):
+        if self.direction:
+            return
+        self.position = self.target = min(1.0, max(0.0, position))
+
+    # 目標の開度 (0.0 - 1.0) を設定する。動作は run() が行う
+    # stamp: 操作の起点の ticks_ms (始動までの遅延の計測用)
+    def move_to(self, target, stamp=None):
+        target = min(1.0, max(0.0, target))
+        if target == self.target:
+            return
+        self.target = target
+        self._stamp = stamp
+        self._idle.clear()
+        self._wake.set()
+
+    # その場で止める
+    # 目標を推定位置にして run() に任せると、run() が見る時にはその先まで進んでいて逆転になるので、ここで止める
+    def stop(self):
+        self._update()
+        self.target = self.position
+        self._stamp = None
+        self._drive(0)
+        self._wake.set()
+
+    def moving(self):
+        return self.direction != 0
+
+    # 駆動中の経過時間を反映した現在の推定位置
+    def estimate(self):
+        if not self.direction:
+            return self.position
+        ms = utime.ticks_diff(utime.ticks_ms(), self._since)
+        stroke = self.open_ms if self.direction == OPENING else self.close_ms
+        return min(1.0, max(0.0, self.position + self.direction * ms / stroke))
+
+    def percent(self):
+        return round(self.estimate() * 100)
+
+    def motor_on_ms(self):
+        return self.on_ms_open + self.on_ms_close
+
+    async def wait_idle(self):
+        await self._idle.wait()
+
+    def _update(self):
+        now = utime.ticks_ms()
+        if self.direction:
+            self.position = self.estimate()
+            ms = utime.ticks_diff(now, self._since)
+            if self.direction == OPENING:
+                self.on_ms_open += ms
+            else:
+                self.on_ms_close += ms
+        self._since = now
+
+    def _drive(self, direction):
+        self._update()
+        if direction == OPENING:
+            self._m1.low()
+            self._m2.high()
+        elif direction == CLOSING:
+            self._m1.high()
+            self._m2.low()
+        else:
+            self._m1.low()
+            self._m2.low()
+            if self.direction:
+                self._stopped = self._since
+        if direction and direction != self.direction:
+            self.starts += 1
+        self.direction = direction
+
+    # 目標までの駆動時間 (ms)
+    def _remaining_ms(self, direction):
+        stroke = self.open_ms if direction == OPENING else self.close_ms
+        ms = abs(self.target - self.position) * stroke
+        if self.target in (0.0, 1.0):
+            ms += self.overtravel * stroke
+        return int(ms)
+
+    async def run(self):
+        while True:
+            self._update()
+            if self.target > self.position:
+                want = OPENING
+            elif self.target < self.position:
+                want = CLOSING
+            else:
+                want = 0
+            if not want:
+                self._stamp = None
+                self._drive(0)
+                self._idle.set()
+                await self._wake.wait()
+                continue
+            if self.direction and want != self.direction:
+                # 逆転: いったん止める
+                self._drive(0)
+                self.reversals += 1
+                await asyncio.sleep_ms(self.reverse_ms)
+                self._stopped = utime.ticks_add(utime.ticks_ms(), -self.settle_ms)
+                continue
+            if not self.direction:
+                wait = self.settle_ms - utime.ticks_diff(utime.ticks_ms(), self._stopped)
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for_ms(self._wake.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self._drive(want)
+            if self._stamp is not None:
+                stamp = self._stamp
+                self._stamp = None
+                for callback in self._subs:
+                    callback(want, stamp)
+            try:
+                await asyncio.wait_for_ms(self._wake.wait(), self._remaining_ms(want))
+                self.preempts += 1
+            except asyncio.TimeoutError:
+                self._update()
+                self.position = self.target
+                self._drive(0)
@@ -0,0 +1,295 @@
+# ベンチマーク: 主要処理の 1 回あたりの時間・メモリ確保量と、各タスクの起床遅れ
+#
+# PC (CPython): sim の代替モジュール上で実行する。時間は実時間、確保量は tracemalloc の目安
+#   python bench.py --out base.json
+#   python bench.py --compare base.json          (20% 以上悪化した項目を表示し終了コード 1)
+# 実機: main.py を止めてから REPL で実行する。lag_sec > 0 は main() を動かすのでモータも動く
+#   import bench; bench.run('/bench.json', lag_sec=0)
+
+import sys
+
+import gc
+import json
+
+_MICROPYTHON = sys.implementation.name == 'micropython'
+
+if _MICROPYTHON:
+    import utime
+
+    def _now_us():
+        return utime.ticks_us()
+
+    def _elapsed_us(t0):
+        return utime.ticks_diff(utime.ticks_us(), t0)
+
+    def _alloc_start():
+        gc.collect()
+        gc.disable()
+        return gc.mem_alloc()
+
+    def _alloc_end(a0):
+        used = gc.mem_alloc() - a0
+        gc.enable()
+        return used
+else:
+    import time
+    import tracemalloc
+
+    def _now_us():
+        return time.perf_counter_ns() // 1000
+
+    def _elapsed_us(t0):
+        return time.perf_counter_ns() // 1000 - t0
+
+    # CPython は参照カウントで即解放されるため、ピーク増分を確保量の目安とする
+    def _alloc_start():
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _alloc_end(a0):
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - a0
+
+
+# 時間は rounds 回の最小値 (割り込みや GC の揺らぎを除く)、確保量は 1 回目の計測
+def measure(fn, n, rounds=5):
+    fn()
+    a0 = _alloc_start()
+    for _ in range(n):
+        fn()
+    alloc = _alloc_end(a0)
+    best = None
+    for _ in range(rounds):
+        t0 = _now_us()
+        for _ in range(n):
+            fn()
+        us = _elapsed_us(t0)
+        if best is None or us < best:
+            best = us
+    return {'n': n, 'us_per_call': round(best / n, 2), 'alloc_bytes_per_call': round(alloc / n, 1)}
+
+
+async def measure_async(make_coro, n):
+    a0 = _alloc_start()
+    t0 = _now_us()
+    for _ in range(n):
+        await make_coro()
+    us = _elapsed_us(t0)
+    alloc = _alloc_end(a0)
+    return {'n': n, 'us_per_call': round(us / n, 2), 'alloc_bytes_per_call': round(alloc / n, 1)}
+
+
+def _task_name(coro):
+    # "<generator object 'ultra' at ...>" / "<coroutine object ultra at ...>"
+    r = repr(coro).split()
+    return r[2].strip("'") if len(r) > 2 else r[0]
+
+
+# main モジュールの asyncio を差し替え、sleep の要求時間に対する実際の起床の遅れをタスク別に集計する
+# 入力待ちのタスク (Subscriber.wait) はタイムアウトで起きた時の遅れを集計する (wait_for / wait_for_ms)
+class LagProbe:
+    def __init__(self, asyncio, ticks_ms, ticks_diff):
+        self._asyncio = asyncio
+        self._ticks_ms = ticks_ms
+        self._ticks_diff = ticks_diff
+        self._names = {}
+        self.stats = {}
+
+    def __getattr__(self, name):
+        return getattr(self._asyncio, name)
+
+    def create_task(self, coro):
+        task = self._asyncio.create_task(coro)
+        self._names[id(task)] = _task_name(coro)
+        return task
+
+    def _record(self, want_ms, t0):
+        lag = self._ticks_diff(self._ticks_ms(), t0) - want_ms
+        task = self._asyncio.current_task()
+        name = self._names.get(id(task), 'main')
+        s = self.stats.get(name)
+        if s is None:
+            s = self.stats[name] = {'count': 0, 'total_ms': 0, 'max_ms': 0}
+        s['count'] += 1
+        s['total_ms'] += lag
+        if lag > s['max_ms']:
+            s['max_ms'] = lag
+
+    async def sleep(self, sec):
+        t0 = self._ticks_ms()
+        await self._asyncio.sleep(sec)
+        self._record(int(sec * 1000), t0)
+
+    async def sleep_ms(self, ms):
+        t0 = self._ticks_ms()
+        await self._asyncio.sleep_ms(ms)
+        self._record(ms, t0)
+
+    async def wait_for(self, aw, timeout):
+        t0 = self._ticks_ms()
+        try:
+            return await self._asyncio.wait_for(aw, timeout)
+        except self._asyncio.TimeoutError:
+            self._record(int(timeout * 1000), t0)
+            raise
+
+    async def wait_for_ms(self, aw, timeout):
+        t0 = self._ticks_ms()
+        try:
+            return await self._asyncio.wait_for_ms(aw, timeout)
+        except self._asyncio.TimeoutError:
+            self._record(timeout, t0)
+            raise
+
+    def report(self):
+        out = {}
+        for name, s in self.stats.items():
+            out[name] = {'count': s['count'], 'mean_ms': round(s['total_ms'] / s['count'], 2), 'max_ms': s['max_ms']}
+        return out
+
+
+def bench_functions(m, asyncio, n=200):
+    results = {}
+    timed_nop = m.PROF.timed('bench_nop')(lambda arg: arg)
+    results['logger'] = measure(lambda: m.logger('bench 測定 41.2cm (g_water_level): 41.3'), n)
+
+    def flush16():
+        for _ in range(16):
+            m.LOG.write('2024/06/01 00:00:00 bench line')
+        m.LOG.flush()
+    results['LOG.flush_16_lines'] = measure(flush16, max(1, n // 20))
+    results['show_status'] = measure(m.show_status, n)
+    values = (41.2, 41.5, 80.0, 41.3, 40.9, 3.0, 41.1)
+    i = [0]
+
+    def push():
+        i[0] = (i[0] + 1) % len(values)
+        m.LEVEL.push(values[i[0]])
+    results['LEVEL.push'] = measure(push, n * 5)
+    t = (2024, 6, 1, 13, 59, 30, 5, 153)
+    results['SCHEDULE.lookup'] = measure(lambda: (m.SCHEDULE.is_active(t), m.SCHEDULE.seconds_until_next(t)), n * 5)
+    results['CLOCK.stamp'] = measure(m.CLOCK.stamp, n * 5)
+    # logger・BLE 送信・LCD の行に被せる PROF.timed 自体の分 (実機では確保 0 のはず)
+    results['PROF.timed'] = measure(lambda: timed_nop(None), n * 5)
+
+    # ultra() の 1 周期分 (main.measure_level をそのまま計る)
+    async def run_cycles():
+        return await measure_async(m.measure_level, max(1, n // 10))
+    results['ultra_cycle'] = asyncio.run(run_cycles())
+    return results
+
+
+def bench_lag(m, asyncio, utime, sec):
+    import events
+    import profiler
+    probe = LagProbe(asyncio, utime.ticks_ms, utime.ticks_diff)
+    m.asyncio = probe
+    profiler.asyncio = probe  # 各タスクの待ちは profiler の Probe 経由
+    events.asyncio = probe  # Probe.wait -> Subscriber.wait のタイムアウト
+
+    async def limited():
+        try:
+            await asyncio.wait_for(m.main(), sec)
+        except asyncio.TimeoutError:
+            pass
+    try:
+        asyncio.run(limited())
+    finally:
+        m.asyncio = asyncio
+        profiler.asyncio = asyncio
+        events.asyncio = asyncio
+    return probe.report()
+
+
+def _report(results, lag):
+    return {
+        'implementation': sys.implementation.name,
+        'platform': sys.platform,
+        'version': sys.version.split()[0],
+        'functions': results,
+        'task_lag_ms': lag,
+    }
+
+
+# 実機用
+def run(out=None, n=200, lag_sec=0):
+    import uasyncio as asyncio
+    import utime
+    import main as m
+    report = _report(bench_functions(m, asyncio, n), bench_lag(m, asyncio, utime, lag_sec) if lag_sec else {})
+    text = json.dumps(report)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text)
+    print(text)
+    return report
+
+
+# PC 用: シミュレータ上で main.py を読み込んで計測する
+def run_host(n=200, lag_days=0.05):
+    from sim import ScriptedLevel, Simulation
+    with Simulation(days=1, level=ScriptedLevel([(0, 8), (3600, 3)], noise_cm=0.3)) as s:
+        m = s.run_main(run=False)
+        asyncio = sys.modules['uasyncio']
+        utime = sys.modules['utime']
+        results = bench_functions(m, asyncio, n)
+        lag = {}
+        if lag_days:
+            s.world.clock.stop_us = None
+            lag = bench_lag(m, asyncio, utime, lag_days * 86400)
+        report = _report(results, lag)
+    report['commit'] = _git_commit()
+    return report
+
+
+def _git_commit():
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 2 つのレポートを比べ、threshold (割合) を超えて悪化した項目を返す
+def compare(base, new, threshold=0.2):
+    worse = []
+    for name, b in base.get('functions', {}).items():
+        r = new.get('functions', {}).get(name)
+        if not r:
+            continue
+        for key in ('us_per_call', 'alloc_bytes_per_call'):
+            if b[key] > 0 and r[key] > b[key] * (1 + threshold):
+                worse.append((name, key, b[key], r[key]))
+    return worse
+
+
+def _main(argv):
+    import argparse
+    ap = argparse.ArgumentParser(description='watergate benchmarks')
+    ap.add_argument('--out', help='JSON レポートの出力先')
+    ap.add_argument('--compare', help='比較元の JSON レポート')
+    ap.add_argument('-n', type=int, default=200)
+    ap.add_argument('--lag-days', type=float, default=0.05, help='起床遅れを測る仮想日数 (0 で省略)')
+    ap.add_argument('--threshold', type=float, default=0.2)
+    args = ap.parse_args(argv)
+    report = run_host(args.n, args.lag_days)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            base = json.load(f)
+        worse = compare(base, report, args.threshold)
+        for name, key, b, r in worse:
+            print(f"悪化: {name} {key} {b} -> {r}")
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
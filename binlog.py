@@ -0,0 +1,225 @@
+# 固定長レコードのバイナリログ
+# テキストログ (log_YYYYMMDD.txt) と並べて /log/log_YYYYMMDD.bin に 1 日 1 ファイルで書く
+#
+# ファイル構成
+#   ヘッダ (12 バイト): b'WGBL', 版, レコード長, 予備 2, その日 0:00 のエポック秒 (I)
+#   分索引 (1440 x I): その分の最初のレコード番号 (無ければ 0xFFFFFFFF)
+#   レコード (12 バイト): エポック秒 (I), イベント (H), 重要度 (B), 門の状態 (B), 値 (f)
+# 時刻範囲の読み出しは索引から開始レコードへ seek するのでファイル全体を読まない
+#
+# PC でも読めるよう struct 以外に依存しない (変換: python binlog.py log_20240601.bin)
+
+import struct
+
+try:
+    import utime as _time
+    _localtime = _time.localtime
+except ImportError:
+    import time as _time
+    _localtime = _time.gmtime  # 機器の時刻は JST のエポック秒なのでそのまま展開する
+
+MAGIC = b'WGBL'
+VERSION = 1
+HEADER_FORMAT = '<4sBBxxI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = '<IHBBf'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+INDEX_OFFSET = HEADER_SIZE
+INDEX_SIZE = 1440 * 4
+DATA_OFFSET = INDEX_OFFSET + INDEX_SIZE
+NO_RECORD = 0xFFFFFFFF
+
+# 重要度
+INFO = 0
+WARN = 1
+ERROR = 2
+
+# イベントと、テキスト形式に戻す時のメッセージ
+EV_BOOT = 1
+EV_LEVEL = 2
+EV_NO_ECHO = 3
+EV_OPEN = 4
+EV_CLOSE = 5
+EV_DRIVE_TIMES = 6
+EV_MODE = 7
+EV_BLE_CMD = 8
+EV_CONFIG = 9
+EV_STATUS = 10
+EV_ERROR = 11
+
+_MODE_NAMES = ('手動', 'auto', 'force', 'log', 'self', 'menu', 'configure', 'test')
+
+EVENT_TEXT = {
+    EV_BOOT: lambda v: 'start',
+    EV_LEVEL: lambda v: f"測定(g_water_level): {round(v, 1)}",
+    EV_NO_ECHO: lambda v: '測定 エコーなし',
+    EV_OPEN: lambda v: f"watergate open: {int(v)}%",
+    EV_CLOSE: lambda v: f"watergate close (現在 {int(v)}%)",
+    EV_DRIVE_TIMES: lambda v: f"運用時間帯切替＝{bool(v)}",
+    EV_MODE: lambda v: f"モード: {_MODE_NAMES[int(v)] if 0 <= int(v) < len(_MODE_NAMES) else int(v)}",
+    EV_BLE_CMD: lambda v: f"BLE RX ({int(v)} バイト)",
+    EV_CONFIG: lambda v: '設定変更',
+    EV_STATUS: lambda v: f"現在水位{round(v, 1)}cm",
+    EV_ERROR: lambda v: 'エラー',
+}
+
+
+def filename(log_dir, t):
+    return f"{log_dir}/log_{t[0]:04d}{t[1]:02d}{t[2]:02d}.bin"
+
+
+class BinLog:
+    def __init__(self, log_dir='/log', capacity=64):
+        self.log_dir = log_dir
+        self._cap = capacity
+        self._buf = bytearray(capacity * RECORD_SIZE)
+        self._n = 0
+        self._day = -1  # 最後に書いたファイルの日 (エポック日)
+        self._last_minute = -1  # その日の索引済みの最後の分
+        self.dropped = 0
+
+    def write(self, epoch, code, value=0.0, level=INFO, gate=0):
+        if self._n == self._cap:
+            self.dropped += 1
+            return
+        struct.pack_into(RECORD_FORMAT, self._buf, self._n * RECORD_SIZE, epoch, code, level, gate, value)
+        self._n += 1
+
+    def pending(self):
+        return self._n
+
+    def _open_day(self, day):
+        path = filename(self.log_dir, _localtime(day * 86400))
+        try:
+            f = open(path, 'r+b')
+        except OSError:
+            f = open(path, 'w+b')
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE, day * 86400))
+            f.write(b'\xff' * INDEX_SIZE)
+        if day != self._day:
+            self._day = day
+            self._last_minute = self._find_last_minute(f)
+        return f
+
+    # 既存ファイルに追記する場合は索引の最後の分を読み直す
+    def _find_last_minute(self, f):
+        f.seek(INDEX_OFFSET)
+        idx = f.read(INDEX_SIZE)
+        last = -1
+        for m in range(1440):
+            if idx[m * 4:m * 4 + 4] != b'\xff\xff\xff\xff':
+                last = m
+        return last
+
+    # 溜まったレコードを日ごとのファイルに追記し、新しい分の索引を埋める
+    def flush(self):
+        if not self._n:
+            return
+        mv = memoryview(self._buf)
+        f = None
+        day = -1
+        try:
+            for i in range(self._n):
+                off = i * RECORD_SIZE
+                epoch = struct.unpack_from('<I', self._buf, off)[0]
+                d = epoch // 86400
+                if d != day:
+                    if f:
+                        f.close()
+                    f = self._open_day(d)
+                    day = d
+                f.seek(0, 2)
+                recno = (f.tell() - DATA_OFFSET) // RECORD_SIZE
+                minute = (epoch % 86400) // 60
+                if minute > self._last_minute:
+                    f.seek(INDEX_OFFSET + minute * 4)
+                    f.write(struct.pack('<I', recno))
+                    self._last_minute = minute
+                    f.seek(0, 2)
+                f.write(mv[off:off + RECORD_SIZE])
+        except Exception as e:
+            print('binlog flush error:' + str(e))
+        finally:
+            if f:
+                f.close()
+        self._n = 0
+
+
+# minute (その日の分) 以降で最初のレコードの番号。無ければ NO_RECORD
+def _first_record(f, minute):
+    buf = bytearray(64)
+    m = max(0, minute)
+    while m < 1440:
+        f.seek(INDEX_OFFSET + m * 4)
+        n = f.readinto(buf) // 4
+        for i in range(min(n, 1440 - m)):
+            recno = struct.unpack_from('<I', buf, i * 4)[0]
+            if recno != NO_RECORD:
+                return recno
+        if not n:
+            break
+        m += n
+    return NO_RECORD
+
+
+def _read_header(f, path):
+    magic, version, size, day_epoch = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+    if magic != MAGIC or size != RECORD_SIZE:
+        raise ValueError('not a binlog file: ' + path)
+    return day_epoch
+
+
+# minute (その日の分) 以降で最初のレコードのファイル内の位置。無ければファイル末尾
+def offset_at(path, minute):
+    with open(path, 'rb') as f:
+        _read_header(f, path)
+        recno = _first_record(f, minute)
+        if recno == NO_RECORD:
+            f.seek(0, 2)
+            return f.tell()
+    return DATA_OFFSET + recno * RECORD_SIZE
+
+
+# path の [start, end] (エポック秒) のレコードを (epoch, code, level, gate, value) で返す
+# 読み出しは chunk 件ずつ再利用バッファに読む
+def read_range(path, start=0, end=0xFFFFFFFF, chunk=32):
+    buf = bytearray(chunk * RECORD_SIZE)
+    with open(path, 'rb') as f:
+        day_epoch = _read_header(f, path)
+        recno = _first_record(f, (start - day_epoch) // 60)
+        if recno == NO_RECORD:
+            return
+        f.seek(DATA_OFFSET + recno * RECORD_SIZE)
+        while True:
+            n = f.readinto(buf) // RECORD_SIZE
+            if not n:
+                return
+            for i in range(n):
+                rec = struct.unpack_from(RECORD_FORMAT, buf, i * RECORD_SIZE)
+                if rec[0] > end:
+                    return
+                if rec[0] >= start:
+                    yield rec
+
+
+# レコードを現行のテキストログの 1 行に戻す
+def to_text(rec):
+    epoch, code, level, gate, value = rec
+    Y, M, D, hr, m, s = _localtime(epoch)[:6]
+    fmt = EVENT_TEXT.get(code)
+    msg = fmt(value) if fmt else f"event {code}: {value}"
+    return f"{Y:04}/{M:02}/{D:02} {hr:02}:{m:02}:{s:02} {msg}"
+
+
+def convert(path, out, start=0, end=0xFFFFFFFF):
+    with open(out, 'w') as f:
+        for rec in read_range(path, start, end):
+            f.write(to_text(rec))
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    import sys
+    for p in sys.argv[1:]:
+        for rec in read_range(p):
+            print(to_text(rec))
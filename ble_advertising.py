@@ -18,10 +18,12 @@ _ADV_TYPE_UUID16_MORE = const(0x2)
 _ADV_TYPE_UUID32_MORE = const(0x4)
 _ADV_TYPE_UUID128_MORE = const(0x6)
 _ADV_TYPE_APPEARANCE = const(0x19)
+_ADV_TYPE_MANUFACTURER = const(0xFF)
  
  
 # Generate a payload to be passed to gap_advertise(adv_data=...).
-def advertising_payload(limited_disc=False, br_edr=False, name=None, services=None, appearance=0):
+# manufacturer: (company_id, data) for a manufacturer-specific field.
+def advertising_payload(limited_disc=False, br_edr=False, name=None, services=None, appearance=0, manufacturer=None):
     payload = bytearray()
  
     def _append(adv_type, value):
@@ -34,7 +36,7 @@ def advertising_payload(limited_disc=False, br_edr=False, name=None, services=No
     )
  
     if name:
-        _append(_ADV_TYPE_NAME, name)
+        _append(_ADV_TYPE_NAME, name.encode() if isinstance(name, str) else name)
  
     if services:
         for uuid in services:
@@ -50,6 +52,22 @@ def advertising_payload(limited_disc=False, br_edr=False, name=None, services=No
     if appearance:
         _append(_ADV_TYPE_APPEARANCE, struct.pack("<h", appearance))
  
+    if manufacturer:
+        _append(_ADV_TYPE_MANUFACTURER, struct.pack("<H", manufacturer[0]) + bytes(manufacturer[1]))
+ 
+    return payload
+ 
+ 
+# Generate a payload to be passed to gap_advertise(resp_data=...).
+# Scan responses carry no flags field.
+def scan_response_payload(name=None, manufacturer=None):
+    payload = bytearray()
+    if name:
+        value = name.encode() if isinstance(name, str) else name
+        payload += struct.pack("BB", len(value) + 1, _ADV_TYPE_NAME) + value
+    if manufacturer:
+        value = struct.pack("<H", manufacturer[0]) + bytes(manufacturer[1])
+        payload += struct.pack("BB", len(value) + 1, _ADV_TYPE_MANUFACTURER) + value
     return payload
  
  
@@ -68,6 +86,15 @@ def decode_name(payload):
     return str(n[0], "utf-8") if n else ""
  
  
+# Manufacturer-specific fields as (company_id, data) pairs.
+def decode_manufacturer(payload):
+    result = []
+    for m in decode_field(payload, _ADV_TYPE_MANUFACTURER):
+        if len(m) >= 2:
+            result.append((m[0] | m[1] << 8, bytes(m[2:])))
+    return result
+ 
+ 
 def decode_services(payload):
     services = []
     for u in decode_field(payload, _ADV_TYPE_UUID16_COMPLETE):
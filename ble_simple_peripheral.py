@@ -4,19 +4,29 @@ import bluetooth
 import random
 import struct
 import time
-from ble_advertising import advertising_payload
+import uasyncio as asyncio
+from ble_advertising import advertising_payload, scan_response_payload
  
 from micropython import const
  
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE = const(3)
+_IRQ_MTU_EXCHANGED = const(21)
  
 _FLAG_READ = const(0x0002)
 _FLAG_WRITE_NO_RESPONSE = const(0x0004)
 _FLAG_WRITE = const(0x0008)
 _FLAG_NOTIFY = const(0x0010)
  
+# ATT notification payload is MTU - 3; the default MTU of 23 leaves 20 bytes.
+_ATT_HEADER_LEN = const(3)
+_DEFAULT_PAYLOAD = const(20)
+_MAX_SEND_FAILURES = const(10)
+_MAX_BACKOFF_MS = const(500)
+# Company ID for the manufacturer-specific status fields (0xFFFF: not assigned, for testing/internal use).
+_COMPANY_ID = const(0xFFFF)
+ 
 _UART_UUID = bluetooth.UUID("6E400001-B5A3-F393-E0A9-E50E24DCCA9E")
 _UART_TX = (
     bluetooth.UUID("6E400003-B5A3-F393-E0A9-E50E24DCCA9E"),
@@ -31,16 +41,70 @@ _UART_SERVICE = (
     (_UART_TX, _UART_RX),
 )
  
+# Binary status frame (see telemetry.py), readable and notifiable.
+_STATUS_UUID = bluetooth.UUID("8B5C0001-3F6E-4C47-9A43-5B2C6F1D7A01")
+_STATUS_CHAR = (
+    bluetooth.UUID("8B5C0002-3F6E-4C47-9A43-5B2C6F1D7A01"),
+    _FLAG_READ | _FLAG_NOTIFY,
+)
+_STATUS_SERVICE = (
+    _STATUS_UUID,
+    (_STATUS_CHAR,),
+)
+ 
  
+# Split data into chunks of at most limit bytes without cutting a UTF-8 sequence.
+def _split_utf8(data, limit):
+    chunks = []
+    i = 0
+    n = len(data)
+    while n - i > limit:
+        end = i + limit
+        while end > i and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        if end == i:
+            end = i + limit
+        chunks.append(data[i:end])
+        i = end
+    chunks.append(data[i:])
+    return chunks
+ 
+ 
+# Pending notification frames for one connection.
+class _TxQueue:
+    def __init__(self):
+        self.payload = _DEFAULT_PAYLOAD
+        self.frames = []
+        self.failures = 0
+ 
+ 
+# UART TX framing: every message sent is terminated by b"\n". Short messages
+# are packed into one notification and long ones are split across several,
+# so the central joins the notifications and splits the stream on newlines.
 class BLESimplePeripheral:
-    def __init__(self, ble, name="MyTanbo"):
+    def __init__(self, ble, name="MyTanbo", mtu=247, tx_queue_frames=32, tx_pace_ms=10):
         self._ble = ble
         self._ble.active(True)
+        self._ble.config(mtu=mtu)
         self._ble.irq(self._irq)
-        ((self._handle_tx, self._handle_rx),) = self._ble.gatts_register_services((_UART_SERVICE,))
+        ((self._handle_tx, self._handle_rx), (self._handle_status,)) = self._ble.gatts_register_services(
+            (_UART_SERVICE, _STATUS_SERVICE)
+        )
         self._connections = set()
         self._write_callback = None
+        self._name = name
         self._payload = advertising_payload(name=name, services=[_UART_UUID])
+        self._resp = None
+        self.adv_updates = 0
+        self.adv_errors = 0
+        self._tx = {}
+        self._tx_flag = asyncio.ThreadSafeFlag()
+        self._tx_queue_frames = tx_queue_frames
+        self._tx_pace_ms = tx_pace_ms
+        self.tx_sent = 0
+        self.tx_dropped = 0
+        self.tx_retries = 0
+        print("Starting advertising")
         self._advertise()
  
     def _irq(self, event, data):
@@ -49,28 +113,124 @@ class BLESimplePeripheral:
             conn_handle, _, _ = data
             print("New connection", conn_handle)
             self._connections.add(conn_handle)
+            self._tx[conn_handle] = _TxQueue()
         elif event == _IRQ_CENTRAL_DISCONNECT:
             conn_handle, _, _ = data
             print("Disconnected", conn_handle)
             self._connections.remove(conn_handle)
+            self._tx.pop(conn_handle, None)
             # Start advertising again to allow a new connection.
+            print("Starting advertising")
             self._advertise()
         elif event == _IRQ_GATTS_WRITE:
             conn_handle, value_handle = data
             value = self._ble.gatts_read(value_handle)
             if value_handle == self._handle_rx and self._write_callback:
                 self._write_callback(value)
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            q = self._tx.get(conn_handle)
+            if q:
+                q.payload = mtu - _ATT_HEADER_LEN
  
+    # Queue data for every connection; tx_task() sends it.
+    # Buffers the caller may reuse (bytearray, memoryview) are copied once.
     def send(self, data):
-        for conn_handle in self._connections:
-            self._ble.gatts_notify(conn_handle, self._handle_tx, data)
+        if isinstance(data, str):
+            data = data.encode()
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        for q in self._tx.values():
+            if not self._enqueue(q, data):
+                self.tx_dropped += 1
+        self._tx_flag.set()
+ 
+    def _enqueue(self, q, data):
+        frames = q.frames
+        data += b"\n"
+        # Coalesce with the last queued frame when both fit in one notification.
+        if frames and len(frames[-1]) + len(data) <= q.payload:
+            frames[-1] = frames[-1] + data
+            return True
+        chunks = _split_utf8(data, q.payload)
+        if len(frames) + len(chunks) > self._tx_queue_frames:
+            return False
+        frames.extend(chunks)
+        return True
+ 
+    # Update the status characteristic and notify subscribed centrals.
+    def set_status(self, data):
+        self._ble.gatts_write(self._handle_status, data, True)
+ 
+    # Broadcast status records for scanners that do not connect.
+    # adv_data goes in the advertising packet next to the service UUID; the
+    # name and resp_data go in the scan response (31 bytes each at most).
+    # gap_advertise is only called when a payload changes.
+    def set_adv_status(self, adv_data, resp_data=None):
+        payload = advertising_payload(services=[_UART_UUID], manufacturer=(_COMPANY_ID, adv_data))
+        resp = scan_response_payload(
+            name=self._name, manufacturer=(_COMPANY_ID, resp_data) if resp_data else None
+        )
+        if payload == self._payload and resp == self._resp:
+            return False
+        self._payload = payload
+        self._resp = resp
+        self.adv_updates += 1
+        self._advertise()
+        return True
+ 
+    def tx_depth(self):
+        return sum(len(q.frames) for q in self._tx.values())
+ 
+    # Largest notification that fits every connection (0 when nobody is connected).
+    def payload_size(self):
+        size = 0
+        for q in self._tx.values():
+            if not size or q.payload < size:
+                size = q.payload
+        return size
+ 
+    async def tx_task(self):
+        backoff_ms = self._tx_pace_ms
+        while True:
+            if not self.tx_depth():
+                await self._tx_flag.wait()
+            failed = False
+            for conn_handle in tuple(self._tx):
+                q = self._tx.get(conn_handle)
+                if not q or not q.frames:
+                    continue
+                try:
+                    self._ble.gatts_notify(conn_handle, self._handle_tx, q.frames[0])
+                    q.frames.pop(0)
+                    q.failures = 0
+                    self.tx_sent += 1
+                except OSError:
+                    # Controller buffers are full; back off and retry the same frame.
+                    failed = True
+                    self.tx_retries += 1
+                    q.failures += 1
+                    if q.failures > _MAX_SEND_FAILURES:
+                        q.frames.pop(0)
+                        q.failures = 0
+                        self.tx_dropped += 1
+            if failed:
+                backoff_ms = min(backoff_ms * 2, _MAX_BACKOFF_MS)
+            else:
+                backoff_ms = self._tx_pace_ms
+            await asyncio.sleep_ms(backoff_ms)
  
     def is_connected(self):
         return len(self._connections) > 0
  
+    # While a central is connected, keep advertising the status as non-connectable.
     def _advertise(self, interval_us=500000):
-        print("Starting advertising")
-        self._ble.gap_advertise(interval_us, adv_data=self._payload)
+        try:
+            self._ble.gap_advertise(
+                interval_us, adv_data=self._payload, resp_data=self._resp, connectable=not self._connections
+            )
+        except (OSError, ValueError):
+            self.adv_errors += 1
  
     def on_write(self, callback):
         self._write_callback = callback
@@ -85,16 +245,23 @@ def demo():
  
     p.on_write(on_rx)
  
-    i = 0
-    while True:
-        if p.is_connected():
-            # Short burst of queued notifications.
-            for _ in range(3):
-                data = str(i) + "_"
-                print("TX", data)
-                p.send(data)
-                i += 1
-        time.sleep_ms(100)
+    async def producer():
+        i = 0
+        while True:
+            if p.is_connected():
+                # Short burst of queued notifications.
+                for _ in range(3):
+                    data = str(i) + "_"
+                    print("TX", data)
+                    p.send(data)
+                    i += 1
+            await asyncio.sleep_ms(100)
+ 
+    async def run():
+        asyncio.create_task(p.tx_task())
+        await producer()
+ 
+    asyncio.run(run())
  
  
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+# 運転状態のチェックポイント (DS1307 の電池で保持される RAM)
+# フラッシュに書かずに門の位置・モード・閉門待ちなどを残し、リセット後の起動で復元する
+# 門が動いている途中 (目標と推定位置が違う) の記録は位置が不確かなので、復元せず閉門で合わせ直す
+# 推定位置は行程ごとに少しずつずれるので、閉門せずに復元した回数 (restores) を記録に含め、呼び出し側で上限を決める
+# 形式を変えたら CHECKPOINT_VERSION を上げる (古い記録は読まれない)
+
+import struct
+
+CHECKPOINT_VERSION = 2
+# 位置(1/10000), 目標(1/10000), 門, モード, 動作中, 閉門待ち(秒), 水位(cm), 連続復元回数, 記録時刻(秒)
+CHECKPOINT_FORMAT = '<HHBBBHfBI'
+CHECKPOINT_SIZE = struct.calcsize(CHECKPOINT_FORMAT)
+
+
+class State:
+    def __init__(self, position, target, gate, mode, moving, countdown_sec, level_cm, restores, time):
+        self.position = position
+        self.target = target
+        self.gate = gate
+        self.mode = mode  # MODE_CODES の値
+        self.moving = moving
+        self.countdown_sec = countdown_sec
+        self.level_cm = level_cm
+        self.restores = restores  # 最後に閉門で位置を合わせてから続けて復元した回数
+        self.time = time
+
+
+class Checkpoint:
+    def __init__(self, rtc):
+        self.rtc = rtc
+        self._buf = bytearray(CHECKPOINT_SIZE)
+        self._last = bytearray(CHECKPOINT_SIZE)  # 最後に書いた内容 (同じなら書かない)
+        self._time = 0  # 最後に書いた記録時刻
+        self.writes = 0
+        self.errors = 0
+
+    # 内容が前回と違う時だけ書く。書いたら True
+    # time は比較に含めないが、記録時刻から refresh_sec 以上経っていれば (時刻が戻った時も) 書き直す
+    # (止まったままの門の記録が古くなって復元されなくなるのを防ぐ。0 なら時刻だけでは書き直さない)
+    def save(self, position, target, gate, mode, moving, countdown_sec, level_cm, restores, time, refresh_sec=0):
+        buf = self._buf
+        struct.pack_into(
+            CHECKPOINT_FORMAT, buf, 0,
+            int(position * 10000 + 0.5),
+            int(target * 10000 + 0.5),
+            gate,
+            mode,
+            1 if moving else 0,
+            max(0, min(0xFFFF, int(countdown_sec))),
+            level_cm,
+            min(0xFF, restores),
+            time,
+        )
+        if buf[:-4] == self._last[:-4] and self.writes:
+            if not refresh_sec or 0 <= time - self._time < refresh_sec:
+                return False
+        try:
+            self.rtc.write_record(CHECKPOINT_VERSION, buf)
+        except OSError:
+            self.errors += 1
+            return False
+        self._last[:] = buf
+        self._time = time
+        self.writes += 1
+        return True
+
+    # 有効な記録があれば State、無ければ None
+    def load(self):
+        try:
+            payload = self.rtc.read_record(CHECKPOINT_VERSION)
+        except OSError:
+            self.errors += 1
+            return None
+        if payload is None or len(payload) != CHECKPOINT_SIZE:
+            return None
+        self._last[:] = payload
+        v = struct.unpack(CHECKPOINT_FORMAT, payload)
+        return State(v[0] / 10000, v[1] / 10000, v[2], v[3], v[4] != 0, v[5], v[6], v[7], v[8])
+
+    def clear(self):
+        try:
+            self.rtc.clear_record()
+        except OSError:
+            self.errors += 1
+        self.writes = 0
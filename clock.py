@@ -0,0 +1,71 @@
+# 時刻の共有キャッシュ
+# time_fn は現地時刻のエポック秒を返す関数 (既定は内蔵 RTC の utime.time)
+# ログの行ごとに localtime() と日時の整形をすると同じ秒の間に同じ文字列を何度も作るため、
+# 秒が変わった時だけ localtime() と "YYYY/MM/DD HH:MM:SS" の整形を行い、
+# 分が変わった時だけ "HH:MM"・日付の文字列と 0 時からの分を作り直す
+# stamp() / hhmm_bytes() は同じバッファを毎秒書き換えるので、保持する側がコピーすること
+# 時間帯の判定などは文字列でなく minute() で比べる
+
+import utime
+from textbuf import TextBuf
+
+
+class Clock:
+    def __init__(self, time_fn=utime.time):
+        self._time = time_fn
+        self._sec = None  # 最後に整形した time_fn()
+        self._epoch_min = None  # 最後に分の値を作った time_fn() // 60
+        self._t = None
+        self._text = TextBuf(19)
+        self._text.datetime((2000, 1, 1, 0, 0, 0))  # 長さは常に 19 なので view は一度だけ作る
+        self._stamp = self._text.view()
+        self._hhmm_b = self._stamp[11:16]
+        self._hhmm = ''
+        self._date = ''
+        self._minute = 0
+        self.refreshes = 0  # 整形した回数 (秒の変わり目ごと)
+
+    def _refresh(self):
+        now = self._time()
+        if now == self._sec:
+            return
+        self._sec = now
+        t = utime.localtime(now)
+        self._t = t
+        self._text.clear().datetime(t)
+        self.refreshes += 1
+        if now // 60 != self._epoch_min:
+            self._epoch_min = now // 60
+            self._minute = t[3] * 60 + t[4]
+            self._hhmm = str(self._hhmm_b, 'ascii')
+            self._date = str(self._stamp[:10], 'ascii')
+
+    # 今の秒の localtime() (同じ秒の間は同じタプル)
+    def localtime(self):
+        self._refresh()
+        return self._t
+
+    # "YYYY/MM/DD HH:MM:SS" (bytes 類)
+    def stamp(self):
+        self._refresh()
+        return self._stamp
+
+    # "HH:MM" (bytes 類)
+    def hhmm_bytes(self):
+        self._refresh()
+        return self._hhmm_b
+
+    # "HH:MM"
+    def hhmm(self):
+        self._refresh()
+        return self._hhmm
+
+    # "YYYY/MM/DD"
+    def date(self):
+        self._refresh()
+        return self._date
+
+    # 0 時からの分 (0 - 1439)
+    def minute(self):
+        self._refresh()
+        return self._minute
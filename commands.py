@@ -0,0 +1,64 @@
+# BLE コマンドのキューと処理の振り分け
+# 受信順の固定長キューに溜め、(モード, コマンド) で登録したハンドラへ 1 回でまとめて渡す
+
+from collections import deque
+import utime
+from events import Latency
+
+
+class CommandQueue:
+    def __init__(self, size=16):
+        self.size = size
+        self._q = deque((), size)
+        self._handlers = {}
+        self.latency = {}  # ハンドラのキー -> Latency (受信から処理完了まで)
+        self.rejected = 0  # キュー満杯で破棄した数
+        self.errors = 0  # ハンドラが例外で終わった数
+
+    # handler は async def handler(cmd)。command=None はそのモードの既定ハンドラ
+    def register(self, mode, command, handler):
+        self._handlers[(mode, command)] = handler
+
+    # 受信したコマンドを積む。満杯なら積まずに False
+    def put(self, mode, command):
+        if len(self._q) >= self.size:
+            self.rejected += 1
+            return False
+        self._q.append((mode, command, utime.ticks_ms()))
+        return True
+
+    def clear(self):
+        while self._q:
+            self._q.popleft()
+
+    def __len__(self):
+        return len(self._q)
+
+    # 溜まっているコマンドを受信順にすべて処理する
+    # 未登録のコマンドは on_unknown(mode, cmd) に渡す
+    # ハンドラの例外は on_error(mode, cmd, e) に渡して次へ進む (1 つの不正なコマンドで止めない)
+    async def drain(self, on_done=None, on_unknown=None, on_error=None):
+        while self._q:
+            mode, cmd, stamp = self._q.popleft()
+            key = (mode, cmd)
+            handler = self._handlers.get(key)
+            if handler is None:
+                key = (mode, None)
+                handler = self._handlers.get(key)
+            if handler is None:
+                if on_unknown:
+                    on_unknown(mode, cmd)
+                continue
+            try:
+                await handler(cmd)
+            except Exception as e:
+                self.errors += 1
+                if on_error:
+                    on_error(mode, cmd, e)
+                continue
+            lat = self.latency.get(key)
+            if lat is None:
+                lat = self.latency[key] = Latency()
+            ms = lat.record(stamp)
+            if on_done:
+                on_done(mode, cmd, ms)
@@ -0,0 +1,116 @@
+# 設定の保存と検証
+# 項目ごとに (型, 最小, 最大, 既定値) を宣言し、BLE からの key=value は eval せずに型変換と範囲検査を行う
+# 保存は一時ファイルに書いてから rename するので、書き込み中に電源が落ちても元の設定が残る
+# 連続した変更は save() で印を付け、run() タスクがまとめて 1 回だけ書き出す
+
+import json
+import uasyncio as asyncio
+import uos
+
+_TRUE = ('true', '1', 'on', 'yes')
+_FALSE = ('false', '0', 'off', 'no')
+
+
+class ConfigStore:
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.values = {key: spec[3] for key, spec in schema.items()}
+        self._subs = []
+        self._dirty = False
+        self._wake = asyncio.Event()
+        self.saves = 0
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    # 変更時に callback(key, value) を呼ぶ
+    def subscribe(self, callback):
+        self._subs.append(callback)
+
+    # 文字列または JSON の値を検査して型を揃える。不正なら ValueError
+    def coerce(self, key, value):
+        typ, lo, hi, _ = self.schema[key]
+        if typ is bool:
+            if isinstance(value, str):
+                t = value.strip().lower()
+                if t in _TRUE:
+                    return True
+                if t in _FALSE:
+                    return False
+                raise ValueError(f"{key}: {value}")
+            if value is True or value is False:
+                return value
+            raise ValueError(f"{key}: {value}")
+        if isinstance(value, bool):
+            raise ValueError(f"{key}: {value}")
+        value = typ(value)
+        if (lo is not None and value < lo) or (hi is not None and value > hi):
+            raise ValueError(f"{key}: {value} ({lo}..{hi})")
+        return value
+
+    # ファイルから読み込む。不正な項目は既定値に戻し、その項目名のリストを返す
+    # ファイルが無い・壊れている場合は既定値で作り直す
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self._dirty = True
+            self.save_now()
+            return ['*']
+        errors = []
+        for key, spec in self.schema.items():
+            if key not in data:
+                self.values[key] = spec[3]
+                continue
+            try:
+                self.values[key] = self.coerce(key, data[key])
+            except (ValueError, TypeError):
+                self.values[key] = spec[3]
+                errors.append(key)
+        return errors
+
+    # 1 項目を更新して購読者に通知し、保存を予約する。不明な項目は KeyError
+    def set(self, key, value):
+        if key not in self.schema:
+            raise KeyError(key)
+        value = self.coerce(key, value)
+        if self.values[key] == value:
+            return value
+        self.values[key] = value
+        for callback in self._subs:
+            callback(key, value)
+        self.save()
+        return value
+
+    # 保存を予約する (run() がまとめて書き出す)
+    def save(self):
+        self._dirty = True
+        self._wake.set()
+
+    # 予約中の変更をすぐに書き出す
+    def save_now(self):
+        if not self._dirty:
+            return False
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.values, f, separators=(',', ': '))
+            uos.rename(tmp, self.path)
+        except OSError as e:
+            print('config save error:' + str(e))
+            return False
+        self._dirty = False
+        self.saves += 1
+        return True
+
+    async def run(self, delay_ms=3000):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            await asyncio.sleep(delay_ms / 1000)
+            self.save_now()
@@ -5,6 +5,9 @@ DATETIME_REG = const(0) # 0x00-0x06
 CHIP_HALT    = const(128)
 CONTROL_REG  = const(7) # 0x07
 RAM_REG      = const(8) # 0x08-0x3F
+RAM_SIZE     = const(56)
+RECORD_MAGIC = const(0xD5)
+RECORD_MAX   = const(51) # RAM_SIZE - magic, version, length, checksum(2)
 
 class DS1307(object):
     """Driver for the DS1307 RTC."""
@@ -69,3 +72,52 @@ class DS1307(object):
         sqw = 1 if sqw > 0 else 0
         reg = rs0 | rs1 << 1 | sqw << 4 | out << 7
         self.i2c.writeto_mem(self.addr, CONTROL_REG, bytearray([reg]))
+
+    def read_ram(self, offset=0, n=RAM_SIZE):
+        """Read n bytes of battery-backed RAM"""
+        n = min(n, RAM_SIZE - offset)
+        return self.i2c.readfrom_mem(self.addr, RAM_REG + offset, n)
+
+    def write_ram(self, data, offset=0):
+        """Write bytes to battery-backed RAM"""
+        if offset + len(data) > RAM_SIZE:
+            raise ValueError("RAM overflow")
+        self.i2c.writeto_mem(self.addr, RAM_REG + offset, data)
+
+    def _checksum(self, buf, n):
+        """Fletcher-16 of the first n bytes"""
+        a = b = 0
+        for i in range(n):
+            a = (a + buf[i]) % 255
+            b = (b + a) % 255
+        return b << 8 | a
+
+    def write_record(self, version, payload):
+        """Store payload (up to RECORD_MAX bytes) in RAM as one checksummed record.
+        The record is written in a single transfer; a torn write fails the checksum."""
+        n = len(payload)
+        if n > RECORD_MAX:
+            raise ValueError("record too long")
+        buf = bytearray(n + 5)
+        buf[0] = RECORD_MAGIC
+        buf[1] = version & 0xFF
+        buf[2] = n
+        buf[3:3 + n] = payload
+        c = self._checksum(buf, n + 3)
+        buf[n + 3] = c & 0xFF
+        buf[n + 4] = c >> 8
+        self.i2c.writeto_mem(self.addr, RAM_REG, buf)
+
+    def read_record(self, version):
+        """Return the stored payload, or None if RAM holds no valid record of this version"""
+        buf = self.i2c.readfrom_mem(self.addr, RAM_REG, RAM_SIZE)
+        n = buf[2]
+        if buf[0] != RECORD_MAGIC or buf[1] != version & 0xFF or n > RECORD_MAX:
+            return None
+        if self._checksum(buf, n + 3) != buf[n + 3] | buf[n + 4] << 8:
+            return None
+        return bytes(buf[3:3 + n])
+
+    def clear_record(self):
+        """Invalidate the stored record"""
+        self.i2c.writeto_mem(self.addr, RAM_REG, bytearray(1))
@@ -0,0 +1,64 @@
+# 入力変化の通知 (publish/subscribe)
+# 水位・運用時間帯・強制スイッチ・BLE コマンドなどの変化をトピックとして通知し、
+# 制御タスクは固定間隔で眠る代わりに入力が変わった時だけ動く
+# 通知は ThreadSafeFlag なので IRQ や BLE コールバックからも publish できる
+
+import uasyncio as asyncio
+import utime
+
+
+class Topic:
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.seq = 0
+        self.stamp = 0  # 最後に publish した ticks_ms
+        self._subs = []
+
+    def publish(self, value=None):
+        self.value = value
+        self.seq += 1
+        self.stamp = utime.ticks_ms()
+        for sub in self._subs:
+            sub.source = self
+            sub._flag.set()
+
+
+class Subscriber:
+    def __init__(self, *topics):
+        self._flag = asyncio.ThreadSafeFlag()
+        self.source = None  # 最後に通知したトピック
+        for topic in topics:
+            topic._subs.append(self)
+
+    # いずれかのトピックが publish されるまで待つ。タイムアウト時は False
+    async def wait(self, timeout=None):
+        if timeout is None:
+            await self._flag.wait()
+            return True
+        try:
+            await asyncio.wait_for(self._flag.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+# 入力 (ticks_ms の時刻) から処理までの遅延 (ms) の集計
+class Latency:
+    def __init__(self):
+        self.last = 0
+        self.max = 0
+        self.total = 0
+        self.count = 0
+
+    def record(self, stamp):
+        ms = utime.ticks_diff(utime.ticks_ms(), stamp)
+        self.last = ms
+        if ms > self.max:
+            self.max = ms
+        self.total += ms
+        self.count += 1
+        return ms
+
+    def avg(self):
+        return self.total // self.count if self.count else 0
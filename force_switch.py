@@ -0,0 +1,53 @@
+# 強制開閉スイッチ
+# 2 本のピンの変化を Pin.irq で受け、最後の変化から debounce_ms 安定したら状態を確定して通知する
+# 通知には最初の変化の時刻 (ticks_ms) を付けるので、押下からモーター始動までの遅延を測れる
+
+import uasyncio as asyncio
+import utime
+from machine import Pin
+
+
+class ForceSwitch:
+    def __init__(self, open_pin, close_pin, debounce_ms=30):
+        self._pins = (open_pin, close_pin)
+        self.debounce_ms = debounce_ms
+        self._flag = asyncio.ThreadSafeFlag()
+        self._edge = utime.ticks_ms()  # 最後の変化の時刻
+        self._first = -1  # 確定前の最初の変化の時刻 (-1: 変化なし)
+        self._subs = []
+        self.state = (open_pin.value(), close_pin.value())
+        self.edges = 0  # 割り込み回数 (チャタリングを含む)
+        self.changes = 0  # 確定した変化の回数
+        for pin in self._pins:
+            pin.irq(self._on_edge, Pin.IRQ_FALLING | Pin.IRQ_RISING, hard=True)
+
+    # 状態が変わった時に callback((open 値, close 値), 最初の変化の ticks_ms) を呼ぶ
+    def subscribe(self, callback):
+        self._subs.append(callback)
+
+    def _on_edge(self, pin):
+        t = utime.ticks_ms()
+        self._edge = t
+        if self._first < 0:
+            self._first = t
+        self.edges += 1
+        self._flag.set()
+
+    async def run(self):
+        while True:
+            await self._flag.wait()
+            # 最後の変化から debounce_ms 変化が無くなるまで待つ
+            while True:
+                quiet = self.debounce_ms - utime.ticks_diff(utime.ticks_ms(), self._edge)
+                if quiet <= 0:
+                    break
+                await asyncio.sleep_ms(quiet)
+            stamp = self._first
+            self._first = -1
+            state = (self._pins[0].value(), self._pins[1].value())
+            if state == self.state:
+                continue
+            self.state = state
+            self.changes += 1
+            for callback in self._subs:
+                callback(state, stamp)
@@ -0,0 +1,55 @@
+# 超音波距離センサ (HC-SR04) の非同期ドライバ
+# ECHO の立ち上がり/立ち下がりを Pin.irq で時刻記録し、測定中もイベントループを止めない
+
+import uasyncio as asyncio
+import utime
+from machine import Pin
+
+SOUND_CM_PER_US = 0.0343
+
+
+class Ultrasonic:
+    def __init__(self, trig, echo, timeout_ms=60):
+        self._trig = trig
+        self._echo = echo
+        self._timeout = timeout_ms / 1000
+        self._flag = asyncio.ThreadSafeFlag()
+        self._edges = -1  # -1: 待機外 0: トリガ済み 1: 立ち上がり検出済み
+        self._rise = 0
+        self._fall = 0
+        self.timeouts = 0  # エコーなしの回数
+        self._trig.low()
+        # hard IRQ にしてスケジューリング遅延を時刻に含めない
+        self._echo.irq(self._on_edge, Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+
+    def _on_edge(self, pin):
+        t = utime.ticks_us()
+        if self._edges == 0:
+            self._rise = t
+            self._edges = 1
+        elif self._edges == 1:
+            self._fall = t
+            self._edges = -1
+            self._flag.set()
+
+    # エコーのパルス幅 (us) を返す。タイムアウト時は None
+    async def measure_us(self):
+        self._flag.clear()
+        self._edges = 0
+        self._trig.high()
+        utime.sleep_us(10)  # トリガパルス幅
+        self._trig.low()
+        try:
+            await asyncio.wait_for(self._flag.wait(), self._timeout)
+        except asyncio.TimeoutError:
+            self._edges = -1
+            self.timeouts += 1
+            return None
+        return utime.ticks_diff(self._fall, self._rise)
+
+    # 距離 (cm) を返す。エコーなしは None
+    async def distance_cm(self):
+        us = await self.measure_us()
+        if us is None:
+            return None
+        return round((us * SOUND_CM_PER_US) / 2, 1)
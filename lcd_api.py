@@ -54,6 +54,7 @@ class LcdApi:
         self.cursor_y = 0
         self.implied_newline = False
         self.backlight = True
+        self._run = bytearray(self.num_columns)  # putstr() line buffer
         self.display_off()
         self.backlight_on()
         self.clear()
@@ -147,8 +148,31 @@ class LcdApi:
     def putstr(self, string):
         # Write the indicated string to the LCD at the current cursor
         # position and advances the cursor position appropriately.
+        # The display advances its own address after each character, so the
+        # characters of one line are sent as a single run and the cursor is
+        # only moved when the text wraps to the next line.
+        run = self._run
+        n = 0
         for char in string:
-            self.putchar(char)
+            if char == '\n':
+                if not self.implied_newline:
+                    self.cursor_x = self.num_columns
+            else:
+                run[n] = ord(char) & 0xff
+                n += 1
+                self.cursor_x += 1
+            if self.cursor_x >= self.num_columns:
+                if n:
+                    self.hal_write_data_bytes(memoryview(run)[:n])
+                    n = 0
+                self.cursor_x = 0
+                self.cursor_y += 1
+                self.implied_newline = (char != '\n')
+                if self.cursor_y >= self.num_lines:
+                    self.cursor_y = 0
+                self.move_to(self.cursor_x, self.cursor_y)
+        if n:
+            self.hal_write_data_bytes(memoryview(run)[:n])
 
     def custom_char(self, location, charmap):
         # Write a character to one of the 8 CGRAM locations, available
@@ -181,6 +205,12 @@ class LcdApi:
         # It is expected that a derived HAL class will implement this function.
         raise NotImplementedError
 
+    def hal_write_data_bytes(self, data):
+        # Write several data bytes to the LCD.
+        # A derived HAL class may override this to send them in one transfer.
+        for byte in data:
+            self.hal_write_data(byte)
+
     def hal_sleep_us(self, usecs):
         # Sleep for some time (given in microseconds)
         time.sleep_us(usecs)
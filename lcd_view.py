@@ -0,0 +1,120 @@
+# 文字 LCD の表示 (差分描画)
+# 表示内容は影のフレームバッファに書き、画面に出ている内容 (_glass) と比べて変わった文字の並びだけを書く
+# clear() しないのでちらつかず、I2C の転送も変化した分だけになる
+# 書き込みは専用タスク (run) が min_interval_ms 以上の間隔で行い、行ごとに他のタスクへ譲る
+# 棒グラフの文字 (左から 1-5 列を埋めた 5 種, 文字コード 0-4) は最初の書き込みの前に一度だけ CGRAM に送る
+#
+#   VIEW.put(0, 1, b'8.1', 5, True)    # 0 行 1 桁目から 5 桁で右寄せ
+#   VIEW.bar(1, 0, 10, 0.45)           # 1 行目に 10 文字の棒グラフ
+#   VIEW.update()                      # 変化があれば run() が書く
+
+import uasyncio as asyncio
+import utime
+
+BAR_STEPS = 5  # 1 文字の横の点数
+# k 列を埋めた文字 (下の 1 行は空けて隣の行と離す)
+BAR_GLYPHS = tuple(bytes([(0x1F << (BAR_STEPS - k)) & 0x1F] * 7 + [0]) for k in range(1, BAR_STEPS + 1))
+MERGE_GAP = 1  # この文字数以下の変わっていない隙間は続けて書く (カーソル移動 1 回と同じ転送量)
+
+
+class LcdView:
+    def __init__(self, lcd, min_interval_ms=500):
+        self.lcd = lcd
+        self.columns = lcd.num_columns
+        self.lines = lcd.num_lines
+        self.min_interval_ms = min_interval_ms
+        self._frame = bytearray(b' ' * (self.columns * self.lines))
+        self._glass = bytearray(self._frame)  # 初期化で clear() 済み
+        self._mv = memoryview(self._frame)
+        self._dirty = asyncio.Event()
+        self._glyphs = False  # 棒グラフの文字を CGRAM に送った
+        self._last = utime.ticks_add(utime.ticks_ms(), -min_interval_ms)
+        self.frames = 0  # 書き込んだ回数
+        self.runs = 0  # 書いた文字の並びの数 (カーソル移動 + 1 転送)
+        self.chars = 0
+        self.errors = 0
+
+    # row 行 col 桁目に data (bytes 類) を書く。width を指定するとその桁数に切り詰め、空白で埋める (right: 右寄せ)
+    def put(self, row, col, data, width=0, right=False):
+        base = row * self.columns
+        end = min(self.columns, col + (width or len(data)))
+        n = min(len(data), end - col)
+        pos = base + col
+        if right and width > n:
+            for i in range(width - n):
+                self._frame[pos + i] = 0x20
+            pos += width - n
+        self._mv[pos:pos + n] = data[:n] if n < len(data) else data
+        for i in range(pos + n, base + end):
+            self._frame[i] = 0x20
+
+    # row 行 col 桁目から width 文字の棒グラフ (fraction: 0.0 - 1.0)
+    def bar(self, row, col, width, fraction):
+        dots = int(max(0.0, min(1.0, fraction)) * width * BAR_STEPS + 0.5)
+        pos = row * self.columns + col
+        for i in range(width):
+            k = min(BAR_STEPS, dots - i * BAR_STEPS)
+            self._frame[pos + i] = k - 1 if k > 0 else 0x20
+
+    # 画面と違う所があれば書き込みを頼む
+    def update(self):
+        if self._frame != self._glass:
+            self._dirty.set()
+
+    def _load_glyphs(self):
+        for i, glyph in enumerate(BAR_GLYPHS):
+            self.lcd.custom_char(i, glyph)
+        self._glyphs = True
+
+    # row 行の変わった所を書く
+    def flush_row(self, row):
+        if not self._glyphs:
+            self._load_glyphs()
+        frame = self._frame
+        glass = self._glass
+        base = row * self.columns
+        col = 0
+        while col < self.columns:
+            if frame[base + col] == glass[base + col]:
+                col += 1
+                continue
+            start = col
+            end = col + 1
+            gap = 0
+            col += 1
+            while col < self.columns:
+                if frame[base + col] != glass[base + col]:
+                    end = col + 1
+                    gap = 0
+                else:
+                    gap += 1
+                    if gap > MERGE_GAP:
+                        break
+                col += 1
+            self.lcd.move_to(start, row)
+            self.lcd.hal_write_data_bytes(self._mv[base + start:base + end])
+            self.lcd.cursor_x = end
+            glass[base + start:base + end] = self._mv[base + start:base + end]
+            self.runs += 1
+            self.chars += end - start
+
+    # すべての行を書く (同期)
+    def flush(self):
+        for row in range(self.lines):
+            self.flush_row(row)
+
+    async def run(self):
+        while True:
+            await self._dirty.wait()
+            wait = self.min_interval_ms - utime.ticks_diff(utime.ticks_ms(), self._last)
+            if wait > 0:
+                await asyncio.sleep_ms(wait)
+            self._dirty.clear()
+            self._last = utime.ticks_ms()
+            self.frames += 1
+            for row in range(self.lines):
+                try:
+                    self.flush_row(row)
+                except OSError:
+                    self.errors += 1
+                await asyncio.sleep_ms(0)
@@ -0,0 +1,134 @@
+# 水位のストリーミングフィルタ
+# 固定長の array('f') 窓に 1 測定ずつ追加し、推定器で水位を更新する
+# 窓と昇順窓は生成時に確保し、測定ごとのリスト生成は行わない
+
+from array import array
+
+
+class LevelFilter:
+    def __init__(self, size=5, estimator=None):
+        self.size = size
+        self.window = array('f', [0] * size)  # 到着順 (リング)
+        self.sorted = array('f', [0] * size)  # 窓の昇順コピー
+        self.scratch = array('f', [0] * size)  # 推定器の作業領域
+        self.n = 0
+        self._pos = 0
+        self.estimator = estimator or ClusteredMean()
+        self.value = None
+
+    def reset(self):
+        self.n = 0
+        self._pos = 0
+        self.value = None
+        if hasattr(self.estimator, 'reset'):
+            self.estimator.reset()
+
+    def push(self, x):
+        if self.n == self.size:
+            self._remove(self.window[self._pos])
+        i = self._pos
+        self.window[i] = x
+        # 窓と同じ単精度の値を入れ、削除時に一致させる
+        self._insert(self.window[i])
+        self._pos = (i + 1) % self.size
+        self.value = self.estimator.estimate(self, x)
+        return self.value
+
+    def _remove(self, v):
+        s = self.sorted
+        n = self.n
+        i = 0
+        while i < n and s[i] != v:
+            i += 1
+        while i < n - 1:
+            s[i] = s[i + 1]
+            i += 1
+        self.n = n - 1
+
+    def _insert(self, v):
+        s = self.sorted
+        i = self.n
+        while i > 0 and s[i - 1] > v:
+            s[i] = s[i - 1]
+            i -= 1
+        s[i] = v
+        self.n += 1
+
+    def median(self):
+        s = self.sorted
+        n = self.n
+        if n == 0:
+            return None
+        if n & 1:
+            return s[n // 2]
+        return (s[n // 2 - 1] + s[n // 2]) / 2
+
+
+# 中央値
+class Median:
+    def estimate(self, f, x):
+        return f.median()
+
+
+# クラスタ化平均: 差が threshold 以内で連なる最大の塊の平均
+class ClusteredMean:
+    def __init__(self, threshold=5):
+        self.threshold = threshold
+
+    def estimate(self, f, x):
+        s = f.sorted
+        n = f.n
+        best_start = 0
+        best_len = 1
+        start = 0
+        for i in range(1, n + 1):
+            if i == n or s[i] - s[i - 1] > self.threshold:
+                if i - start > best_len:
+                    best_start = start
+                    best_len = i - start
+                start = i
+        total = 0
+        for i in range(best_start, best_start + best_len):
+            total += s[i]
+        return total / best_len
+
+
+# Hampel フィルタ: 中央値から k*MAD を超えて外れた測定は中央値に置き換える
+class Hampel:
+    def __init__(self, k=3.0):
+        self.k = k
+
+    def estimate(self, f, x):
+        med = f.median()
+        d = f.scratch
+        n = f.n
+        for i in range(n):
+            v = abs(f.sorted[i] - med)
+            j = i
+            while j > 0 and d[j - 1] > v:
+                d[j] = d[j - 1]
+                j -= 1
+            d[j] = v
+        mad = d[n // 2] if n & 1 else (d[n // 2 - 1] + d[n // 2]) / 2
+        if abs(x - med) > self.k * 1.4826 * mad:
+            return med
+        return x
+
+
+# 指数移動平均。inner を指定するとその推定値を平滑化する
+class Ema:
+    def __init__(self, alpha=0.3, inner=None):
+        self.alpha = alpha
+        self.inner = inner
+        self._v = None
+
+    def reset(self):
+        self._v = None
+
+    def estimate(self, f, x):
+        v = self.inner.estimate(f, x) if self.inner else x
+        if self._v is None:
+            self._v = v
+        else:
+            self._v += self.alpha * (v - self._v)
+        return self._v
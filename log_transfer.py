@@ -0,0 +1,273 @@
+# BLE での過去ログのダウンロード
+# /log に残っているファイルの一覧と、バイト範囲または時刻範囲の分割転送を行う
+#
+# 塊は番号付きの 1 行 (D <番号> <オフセット> <base64>) で、1 回の通知に収まる大きさで送る
+# 受信側は ack <オフセット> で受け取り済みの位置を返す。未確認の塊が window 個になったら
+# ack を待ち、来なければ確認済みの位置から送り直す
+# 切断しても転送状態は残るので、再接続後 resume で最後に確認された位置から続ける
+# ファイルは塊ごとに再利用バッファへ読むので、何日分でもファイル全体を RAM に載せない
+# store (RingStore) のセグメントは古い順に並べ、使用済みの範囲だけを送る
+#
+# コマンド
+#   ls                            一覧      -> LS <名前> <バイト数> ... LS END <件数>
+#   get <名前> [開始 [終了]]       バイト範囲 (終了は含まない。省略時はファイル末尾)
+#   time <名前> <HH:MM> [HH:MM]    時刻範囲 (.bin は分索引、日ごとの .txt は行頭の日時で位置を求める。
+#                                 セグメントは日をまたぎ時刻順とも限らないので不可。get で取る)
+#   ack <オフセット>               受信済みの位置
+#   resume                        最後に確認された位置から再開
+#   cancel                        中止
+# 応答
+#   D <番号> <オフセット> <base64> / EOF <名前> <終了オフセット> / ERR <理由>
+
+import binascii
+import uasyncio as asyncio
+import uos
+import binlog
+
+_LINE_HEADER = 24  # "D <番号> <オフセット> " と改行の最大長
+_MIN_CHUNK = 12  # これより小さい塊しか送れない MTU では転送しない
+
+
+class LogTransfer:
+    COMMANDS = (b'ls', b'get', b'time', b'ack', b'resume', b'cancel')
+
+    def __init__(self, ble_sp, log_dir='/log', log=print, chunk_max=192, window=8, ack_timeout_ms=3000, retries=5, store=None):
+        self._ble = ble_sp
+        self._store = store
+        self.log_dir = log_dir
+        self._log = log
+        self._buf = bytearray(chunk_max - chunk_max % 3)
+        self._mv = memoryview(self._buf)
+        self._scan = bytearray(64)
+        self.window = window
+        self.ack_timeout_ms = ack_timeout_ms
+        self.retries = retries
+        self._wake = asyncio.ThreadSafeFlag()
+        self._req = None  # run() が処理する ls/get/time/resume/cancel
+        self.name = None  # 転送中 (または中断中) のファイル
+        self.start = 0
+        self.end = 0
+        self.acked = 0  # 受信側が確認した位置
+        self.sent = 0  # 次に送る位置
+        self.seq = 0
+        self.active = False
+        self._tries = 0
+        self.resends = 0  # ack 待ちのタイムアウトで送り直した回数
+        self.bytes_sent = 0
+
+    # BLE 受信コールバックから呼ぶ。ファイル操作は run() で行う
+    def command(self, cmd):
+        args = cmd.split()
+        if not args or args[0] not in self.COMMANDS:
+            return False
+        if args[0] == b'ack':
+            try:
+                off = int(args[1])
+            except (IndexError, ValueError):
+                return True
+            if self.start <= off <= self.end and off > self.acked:
+                self.acked = off
+                self._wake.set()
+            return True
+        self._req = args
+        self._wake.set()
+        return True
+
+    def _send(self, line):
+        self._ble.send(line)
+
+    async def _tx_room(self):
+        while self._ble.tx_depth() >= self.window:
+            await asyncio.sleep_ms(20)
+
+    def _path(self, name):
+        if not name or '/' in name or name.startswith('.'):
+            raise ValueError('name')
+        path = f"{self.log_dir}/{name}"
+        size = self._store.size_of(name) if self._store else None
+        return path, uos.stat(path)[6] if size is None else size
+
+    async def _list(self):
+        n = 0
+        for name in sorted(uos.listdir(self.log_dir)):
+            if self._store and self._store.owns(name):
+                continue
+            try:
+                _, size = self._path(name)
+            except (OSError, ValueError):
+                continue
+            await self._tx_room()
+            self._send(f"LS {name} {size}")
+            n += 1
+        if self._store:
+            for name, size in self._store.segments():
+                await self._tx_room()
+                self._send(f"LS {name} {size}")
+                n += 1
+        self._send(f"LS END {n}")
+
+    # HH:MM をその日の分に
+    def _minute(self, arg):
+        h, m = arg.split(b':')
+        minute = int(h) * 60 + int(m)
+        if not 0 <= minute < 1440:
+            raise ValueError('time')
+        return minute
+
+    def _begin(self, args):
+        name = args[1].decode()
+        path, size = self._path(name)
+        if args[0] == b'time':
+            if self._store and self._store.owns(name):
+                raise ValueError('segment')
+            first = self._minute(args[2])
+            last = self._minute(args[3]) if len(args) > 3 else 1439
+            start = self._time_offset(name, path, size, first)
+            end = self._time_offset(name, path, size, last + 1) if last < 1439 else size
+        else:
+            start = int(args[2]) if len(args) > 2 else 0
+            end = min(int(args[3]), size) if len(args) > 3 else size
+        if not 0 <= start <= end:
+            raise ValueError('range')
+        self.name = name
+        self.start = self.acked = self.sent = start
+        self.end = end
+        self.seq = 0
+        self._tries = 0
+        self.active = True
+        self._log(f"ログ転送開始: {name} {start}-{end}")
+
+    def _handle(self, args):
+        op = args[0]
+        if op == b'cancel':
+            self.active = False
+            self.name = None
+        elif op == b'resume':
+            if self.name is None:
+                self._send('ERR no transfer')
+                return
+            self.sent = self.acked
+            self._tries = 0
+            self.active = True
+        else:
+            try:
+                self._begin(args)
+            except (IndexError, ValueError, TypeError, OSError) as e:
+                self._send(f"ERR {op.decode()} {e}")
+
+    # 時刻 (その日の分) 以降で最初の行またはレコードのファイル内の位置
+    # テキストは日ごとのファイル (log_YYYYMMDD.txt) だけで、"YYYY/MM/DD HH:MM" 全体で比べる
+    def _time_offset(self, name, path, size, minute):
+        if minute >= 1440:
+            return size
+        if path.endswith('.bin'):
+            return binlog.offset_at(path, minute)
+        if len(name) != 16 or not name.startswith('log_') or not name[4:12].isdigit():
+            raise ValueError('name')
+        date = f"{name[4:8]}/{name[8:10]}/{name[10:12]}".encode()
+        key = date + b' %02d:%02d' % (minute // 60, minute % 60)
+        with open(path, 'rb') as f:
+            # その日の日時の行は時刻順なので位置で二分探索する
+            lo, hi = 0, size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                start, stamp = self._line_after(f, mid, size, date)
+                if stamp is None or stamp >= key:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return self._line_after(f, lo, size, date)[0]
+
+    # pos 以降に始まる最初の date の日時の行 (位置, b'YYYY/MM/DD HH:MM')。無ければ (size, None)
+    # テキストログの行は "YYYY/MM/DD HH:MM:SS ..." で始まる
+    # 別の日付の行 (時刻を合わせる前に書いた行など) は時刻順に並んでいないので飛ばす
+    def _line_after(self, f, pos, size, date):
+        buf = self._scan
+        if pos > 0:
+            pos = self._next_line(f, pos - 1, size)
+        while pos < size:
+            f.seek(pos)
+            n = f.readinto(buf)
+            if n >= 16 and buf[13] == 0x3A and buf[:10] == date:
+                return pos, bytes(buf[:16])
+            pos = self._next_line(f, pos, size)
+        return size, None
+
+    # pos 以降の最初の改行の次の位置
+    def _next_line(self, f, pos, size):
+        buf = self._scan
+        while pos < size:
+            f.seek(pos)
+            n = f.readinto(buf)
+            if not n:
+                break
+            for i in range(n):
+                if buf[i] == 0x0A:
+                    return pos + i + 1
+            pos += n
+        return size
+
+    def _chunk_size(self):
+        n = min(len(self._buf), (self._ble.payload_size() - _LINE_HEADER) * 3 // 4)
+        return n - n % 3
+
+    async def _pump(self):
+        n = self._chunk_size()
+        if n < _MIN_CHUNK:
+            self._send(f"ERR mtu {self._ble.payload_size()}")
+            self.active = False
+            return
+        path = f"{self.log_dir}/{self.name}"
+        try:
+            with open(path, 'rb') as f:
+                while self.active and self._req is None and self.sent < self.end and self.sent - self.acked < n * self.window:
+                    await self._tx_room()
+                    f.seek(self.sent)
+                    got = f.readinto(self._mv[:min(n, self.end - self.sent)])
+                    if not got:
+                        self.end = self.sent
+                        break
+                    self._send(f"D {self.seq} {self.sent} {binascii.b2a_base64(self._mv[:got]).decode().strip()}")
+                    self.seq += 1
+                    self.sent += got
+                    self.bytes_sent += got
+        except OSError as e:
+            self._send(f"ERR read {e}")
+            self.active = False
+            return
+        if self.acked >= self.end:
+            self._send(f"EOF {self.name} {self.end}")
+            self._log(f"ログ転送完了: {self.name} {self.end}")
+            self.active = False
+            return
+        acked = self.acked
+        while self.acked == acked and self._req is None:
+            try:
+                await asyncio.wait_for_ms(self._wake.wait(), self.ack_timeout_ms)
+            except asyncio.TimeoutError:
+                # ack が来ない: 確認済みの位置から送り直す
+                self._tries += 1
+                self.resends += 1
+                if self._tries > self.retries or not self._ble.is_connected():
+                    self.active = False  # resume を待つ
+                else:
+                    self.sent = self.acked
+                return
+        self._tries = 0
+
+    async def run(self):
+        while True:
+            if not (self.active and self._ble.is_connected()) and self._req is None:
+                await self._wake.wait()
+            req = self._req
+            self._req = None
+            if req is not None:
+                if req[0] == b'ls':
+                    try:
+                        await self._list()
+                    except OSError as e:
+                        self._send(f"ERR ls {e}")
+                else:
+                    self._handle(req)
+            if self.active and self._ble.is_connected():
+                await self._pump()
@@ -0,0 +1,169 @@
+# ログのバッファリング出力
+# logger() から毎回ファイルを開閉するとフラッシュ書き込みでイベントループが止まるため、
+# 行を RAM のリングバッファに溜めてバックグラウンドタスクでまとめて書き出す
+# store (RingStore) を渡すと日ごとのファイルの代わりに事前確保したセグメントへ書く
+# 行は事前確保した bytearray に改行付きでコピーするので、溜めている間ヒープに文字列を残さない
+# (行は途中で折り返さず、末尾に入らなければ先頭から書く。書き出しは連続した範囲ごとに 1 回)
+
+import array
+import uasyncio as asyncio
+import utime
+import uos
+
+
+class LogSink:
+    def __init__(self, log_dir='/log', retain_days=7, capacity=64, flush_lines=16, max_age_ms=10000, store=None, buffer_bytes=8192):
+        self.log_dir = log_dir
+        self.retain_days = retain_days
+        self._cap = capacity
+        self._flush_lines = min(flush_lines, capacity)
+        self._max_age_ms = max_age_ms
+        self._buf = bytearray(buffer_bytes)
+        self._mv = memoryview(self._buf)
+        typecode = 'H' if buffer_bytes <= 0xFFFF else 'I'
+        self._start = array.array(typecode, [0] * capacity)  # 行の先頭位置
+        self._end = array.array(typecode, [0] * capacity)  # 改行を含む行の終わり
+        self._head = 0  # 最古の行の番号
+        self._count = 0
+        self._first_ms = 0  # 最古の行を受け付けた時刻
+        self._wake = asyncio.Event()
+        self._day = None  # 最後にフラッシュした日 (日付変更時に古いログを削除)
+        self._dropped_pending = 0
+        self.dropped = 0  # 溢れて捨てた行数 (累計)
+        self.flushes = 0
+        self._sinks = []  # 同じタイミングで flush() する他の出力 (バイナリログ等)
+        self.store = store
+
+    def attach(self, sink):
+        self._sinks.append(sink)
+
+    def _drop_oldest(self):
+        self._head = (self._head + 1) % self._cap
+        self._count -= 1
+        self._dropped_pending += 1
+        self.dropped += 1
+
+    # n バイトの書き込み位置を返す。空きが無ければ最古の行から捨てる
+    def _reserve(self, n):
+        while self._count:
+            if self._count < self._cap:
+                pos = self._end[(self._head + self._count - 1) % self._cap]
+                oldest = self._start[self._head]
+                if pos > oldest:
+                    # 折り返していない: 末尾の空きか、先頭から最古の行までの空き
+                    if n <= len(self._buf) - pos:
+                        return pos
+                    if n <= oldest:
+                        return 0
+                elif n <= oldest - pos:
+                    return pos
+            self._drop_oldest()
+        return 0
+
+    # line (str または bytes 類) を 1 行として溜める。満杯の場合は最古の行から捨てる
+    # 領域の確保と行数の更新の間に割り込まれると同じ範囲を二重に使うので、タスクからだけ呼ぶ (IRQ のコールバックからは不可)
+    def write(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        n = min(len(line), len(self._buf) - 1)
+        pos = self._reserve(n + 1)
+        self._mv[pos:pos + n] = line[:n] if n < len(line) else line
+        self._buf[pos + n] = 0x0A
+        i = (self._head + self._count) % self._cap
+        self._start[i] = pos
+        self._end[i] = pos + n + 1
+        self._count += 1
+        if self._count == 1:
+            self._first_ms = utime.ticks_ms()
+            self._wake.set()
+        elif self._count >= self._flush_lines:
+            self._wake.set()
+
+    def pending(self):
+        return self._count
+
+    def filename(self, t=None):
+        t = t or utime.localtime()
+        return f"{self.log_dir}/log_{t[0]:04d}{t[1]:02d}{t[2]:02d}.txt"
+
+    def ensure_dir(self):
+        if self.log_dir.lstrip('/') not in uos.listdir('/'):
+            try:
+                uos.mkdir(self.log_dir)
+            except:
+                pass
+
+    def delete_old(self):
+        try:
+            now = utime.time()
+            for fname in uos.listdir(self.log_dir):
+                if fname.startswith("log_") and (fname.endswith(".txt") or fname.endswith(".bin")):
+                    try:
+                        y = int(fname[4:8])
+                        m = int(fname[8:10])
+                        d = int(fname[10:12])
+                        log_time = utime.mktime((y, m, d, 0, 0, 0, 0, 0))
+                        if now - log_time > self.retain_days * 86400:
+                            uos.remove(f"{self.log_dir}/{fname}")
+                            print(f"削除: {fname}")
+                    except Exception as e:
+                        print("ログファイル日付解析エラー:", fname, e)
+        except Exception as e:
+            print("ログ削除処理エラー:", e)
+
+    # 溜まっている行を書き出す (reset() 前にも同期で呼ぶ)
+    def flush(self):
+        t = utime.localtime()
+        if self._day != t[:3]:
+            try:
+                self.ensure_dir()
+                self.delete_old()
+                self._day = t[:3]
+            except Exception as e:
+                print('log flush error:' + str(e))
+        if self._count or self._dropped_pending:
+            try:
+                if self.store:
+                    self._write(self.store.append)
+                else:
+                    with open(self.filename(t), 'a') as f:
+                        self._write(f.write)
+                self.flushes += 1
+            except Exception as e:
+                print('log flush error:' + str(e))
+            self._head = (self._head + self._count) % self._cap
+            self._count = 0
+            self._dropped_pending = 0
+        for sink in self._sinks:
+            sink.flush()
+
+    # 行は最大 2 つの連続した範囲 (折り返しの前と後) にあるので、範囲ごとに out() に渡す
+    def _write(self, out):
+        if self._dropped_pending:
+            out(f"ログ欠落 {self._dropped_pending} 行\n".encode())
+        if not self._count:
+            return
+        run_start = self._start[self._head]
+        run_end = self._end[self._head]
+        for k in range(1, self._count):
+            i = (self._head + k) % self._cap
+            if self._start[i] != run_end:
+                out(self._mv[run_start:run_end])
+                run_start = self._start[i]
+            run_end = self._end[i]
+        out(self._mv[run_start:run_end])
+
+    # 行数または経過時間の閾値でフラッシュするバックグラウンドタスク
+    async def run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._count < self._flush_lines:
+                remain = self._max_age_ms - utime.ticks_diff(utime.ticks_ms(), self._first_ms)
+                if remain > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), remain / 1000)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+            self.flush()
@@ -1,14 +1,49 @@
 # 水門開閉管理 2024.4.8 リファクタ版（閉門までの待機に変更）
 
 import uasyncio as asyncio
-from machine import SoftI2C, Pin, RTC, reset
+from machine import SoftI2C, Pin, reset
 from ds1307 import DS1307
 import utime
 import json
 import bluetooth
 from ble_simple_peripheral import BLESimplePeripheral
+from logbuf import LogSink
+from ring_store import RingStore
+from hcsr04 import Ultrasonic
+from level_filter import LevelFilter, ClusteredMean
+from schedule import Schedule
+from events import Topic, Subscriber, Latency
+from telemetry import StatusFrame, AdvStatus, Uptime, MODE_CODES
+from binlog import BinLog, INFO, WARN, ERROR, EV_BOOT, EV_LEVEL, EV_NO_ECHO, EV_OPEN, EV_CLOSE, EV_DRIVE_TIMES, EV_MODE, EV_BLE_CMD, EV_CONFIG, EV_STATUS, EV_ERROR
+from commands import CommandQueue
+from config_store import ConfigStore
+from log_transfer import LogTransfer
+from startup import Startup
+from actuator import Actuator
+from force_switch import ForceSwitch
+from profiler import Profiler
+from textbuf import TextBuf
+from clock import Clock
+from checkpoint import Checkpoint
+from timebase import TimeBase, Periodic
+from pico_i2c_lcd import I2cLcd
+from lcd_view import LcdView
 import uos
 
+# 起動の段階ごとの時間 (この時点を起点とする)
+BOOT = Startup()
+
+# 実行状況の計測 (False にすると計測を省く)
+PROFILE_ENABLED = True
+PROF = Profiler(PROFILE_ENABLED)
+P_ULTRA = PROF.probe('ultra')
+P_DRIVE_TIMES = PROF.probe('check_drive_times')
+P_AUTO = PROF.probe('auto_drive')
+P_STATUS = PROF.probe('show_status_service')
+P_MAIN = PROF.probe('main')
+# 空きヒープがこれを下回ったら測定の合間に GC する (処理の途中で自動の GC が走るのを避ける)
+HEAP_MIN_FREE = 64 * 1024
+
 # BLE モード定数
 BLE_MODE_LOG = 'log'
 BLE_MODE_MENU = 'menu'
@@ -21,6 +56,7 @@ BLE_MODE_TEST = 'test'
 # 強制制御ピン
 FORCE_OPEN = Pin(2, Pin.IN, Pin.PULL_UP)
 FORCE_CLOSE = Pin(3, Pin.IN, Pin.PULL_UP)
+FORCE_SW = ForceSwitch(FORCE_OPEN, FORCE_CLOSE)
 
 # モーター制御ピン
 M1 = Pin(12, Pin.OUT)
@@ -29,17 +65,63 @@ M2 = Pin(13, Pin.OUT)
 # 距離測定ピン
 ECHO = Pin(14, Pin.IN, Pin.PULL_DOWN)
 TRIG = Pin(15, Pin.OUT)
+SONAR = Ultrasonic(TRIG, ECHO)
+
+# 水位フィルタ (直近 5 回の測定のクラスタ化平均)
+LEVEL = LevelFilter(5, ClusteredMean(5))
 
 # BLE 初期化
 BLE = bluetooth.BLE()
 BLE_SP = BLESimplePeripheral(BLE)
+BLE_SP.send = PROF.timed('ble_send')(BLE_SP.send)
+
+# I2C (DS1307 と LCD で共有)
+I2C_BUS = SoftI2C(scl=Pin(1), sda=Pin(0), freq=100000)
+
+# RTC (DS1307)。電池で保持される RAM に運転状態を残し、リセット後に復元する
+RTC_DS = DS1307(I2C_BUS)
+CHECKPOINT = Checkpoint(RTC_DS)
+
+# 状態表示の LCD (PCF8574 経由の 16x2。無ければ表示しない)
+LCD_ADDR = 0x27
+LCD_LINES = 2
+LCD_COLUMNS = 16
+LCD_MIN_INTERVAL_MS = 500  # 書き込みの最短間隔
+LCD_BAR_CM = 20  # 水位の棒グラフが一杯になる水位
+LCD_VIEW = None
+
+# 時刻 (ticks_ms 基準の単調な時刻を DS1307 に定期的に合わせる。DS1307 は UTC)
+TZ_OFFSET_SEC = 9 * 3600  # JST = UTC + 9 時間
+RTC_RESYNC_SEC = 3600
+TIME = TimeBase(RTC_DS, TZ_OFFSET_SEC, RTC_RESYNC_SEC)
+# 日時の文字列 (秒・分が変わった時だけ作る)
+CLOCK = Clock(TIME.time)
+MODE_NAMES = {code: mode for mode, code in MODE_CODES.items()}
 
 # ファイル定数
 CONFIG_JSON_FILE = '/config.json'
 OPE_TIME_JSON_FILE = '/operation_time.json'
 LOG_FILE = '/operation.log'
 LOG_DIR = '/log'
-LOG_RETAIN_DAYS = 7  # 保存日数
+LOG_RETAIN_DAYS = 7  # 日ごとのファイル (バイナリログ) の保存日数
+# テキストログは固定で 256KB。保存の目標は LOG_RETAIN_DAYS (7 日)
+# 周期的な行を LOG_PERIODIC_MS ごとに間引いた状態で 1 日 20-30KB (シミュレータ) なので 9-12 日分入る
+LOG_SEGMENTS = 8  # テキストログのセグメント数
+LOG_SEGMENT_BYTES = 32768  # 1 セグメントの大きさ
+LOG_BUFFER_LINES = 64  # RAM に保持する最大行数
+LOG_FLUSH_LINES = 16  # この行数溜まったら書き出す
+LOG_FLUSH_MS = 10000  # 最古の行がこの時間経過したら書き出す
+# 周期的な行 (測定・状態・エコーなし) をテキストログに書く間隔。水位が LOG_LEVEL_DELTA_CM 以上変わった時は間隔によらず書く
+# (測定ごとの値はバイナリログに残る)
+LOG_PERIODIC_MS = 600 * 1000
+LOG_LEVEL_DELTA_CM = 1.0
+
+# ログバッファ (テキストログは事前確保したセグメントを循環して使う)
+LOG_RING = RingStore(LOG_DIR, LOG_SEGMENTS, LOG_SEGMENT_BYTES)
+LOG = LogSink(LOG_DIR, LOG_RETAIN_DAYS, LOG_BUFFER_LINES, LOG_FLUSH_LINES, LOG_FLUSH_MS, LOG_RING)
+# 固定長のバイナリログ (テキストログと同じタイミングで書き出す)
+BINLOG = BinLog(LOG_DIR, LOG_BUFFER_LINES)
+LOG.attach(BINLOG)
 
 # 状態定数
 OPENCLOSE_OPEN = 0
@@ -54,36 +136,76 @@ g_water_level = 0
 g_is_drive_times = False
 g_open_close = OPENCLOSE_OPEN
 g_count_down_until_closing = 0  # 閉門までの待機用
+g_close_at = None  # 閉門待ちの期限 (ticks_ms)。None: 数えていない
 g_ble_ope_mode = None
-g_ble_commands = []
-
-# デフォルト設定 　# 80
-g_config_dic = {
-    "water_level_correction_mm": 50,
-    "waiting_for_interval_sec": 5,
-    "open_closing_standards_mm": 7,
-    "open_time_sec": 20,
-    "close_time_sec": 40,
-    "wait_before_closing_sec": 120,
-    "ope_time_1": False,
-    "ope_time_2": True,
-    "ope_time_3": False,
-    "ope_time_4": False,
-    "ope_time_5": True,
-    "ope_time_6": False,
-    "ope_time_7": True,
-    "ope_time_8": False
+g_restored = False  # 門の位置を DS1307 の記録から復元した (起動時の閉門を省く)
+g_restores = 0  # 最後に閉門で位置を合わせてから続けて復元した回数 (記録に残す)
+
+# BLE コマンド (受信順に処理)
+COMMANDS = CommandQueue(16)
+# BLE の受信 (on_rx で積み、ble_rx タスクで処理する)
+BLE_RX = CommandQueue(16)
+BLE_RX_FLAG = asyncio.ThreadSafeFlag()
+
+# 入力変化の通知
+T_LEVEL = Topic('level')  # 水位の新しい推定値
+T_DRIVE_TIMES = Topic('drive_times')  # 運用時間帯の切替
+T_SCHEDULE = Topic('schedule')  # 運用時間帯の設定変更
+T_FORCE = Topic('force')  # 強制スイッチの変化
+T_BLE_CMD = Topic('ble_cmd')  # BLE コマンド受信
+T_MODE = Topic('mode')  # 運転モードの変化
+# バイナリ状態フレーム
+STATUS_FRAME = StatusFrame()
+# 広告に載せる状態 (接続しない監視用。値が変わった時だけ広告を書き換える)
+ADV_STATUS = AdvStatus()
+UPTIME = Uptime()
+
+DECISION_LATENCY = Latency()  # 入力から自動運転の判定までの遅延
+FORCE_LATENCY = Latency()  # 強制スイッチの押下からモーター始動までの遅延
+
+# 起動時の閉門 (初期位置合わせ) の完了。完了まで自動運転は待つ
+HOMED = asyncio.Event()
+
+# 運用時間帯 (load_config 後にコンパイル)
+SCHEDULE = Schedule()
+
+# 設定項目 (型, 最小, 最大, 既定値)
+CONFIG_SCHEMA = {
+    "water_level_correction_mm": (int, 0, 500, 50),
+    "waiting_for_interval_sec": (int, 1, 3600, 5),
+    "open_closing_standards_mm": (int, 0, 100, 7),
+    "open_time_sec": (int, 1, 300, 20),
+    "close_time_sec": (int, 1, 300, 40),
+    "overtravel_percent": (int, 0, 50, 0),  # 全開・全閉で全行程に対して余分に回す割合
+    "wait_before_closing_sec": (int, 0, 3600, 120),
+    "measure_interval_sec": (int, 1, 600, 3),
+    "restore_max_age_sec": (int, 0, 86400, 3600),  # これより古い状態の記録は復元せず閉門する (0: 常に閉門)
+    "restore_max_count": (int, 0, 100, 5),  # 閉門せずに続けて復元する回数の上限
+    "ope_time_1": (bool, None, None, False),
+    "ope_time_2": (bool, None, None, True),
+    "ope_time_3": (bool, None, None, False),
+    "ope_time_4": (bool, None, None, False),
+    "ope_time_5": (bool, None, None, True),
+    "ope_time_6": (bool, None, None, False),
+    "ope_time_7": (bool, None, None, True),
+    "ope_time_8": (bool, None, None, False)
 }
+CONFIG = ConfigStore(CONFIG_JSON_FILE, CONFIG_SCHEMA)
+g_config_dic = CONFIG.values
+
+# 水門モーター (開閉は専用タスクで行い、位置は駆動時間から推定する)
+GATE = Actuator(M1, M2, g_config_dic['open_time_sec'], g_config_dic['close_time_sec'], overtravel=g_config_dic['overtravel_percent'] / 100)
+
+# 全開・全閉の時間と余分に回す割合を GATE に反映する
+def configure_gate():
+    GATE.configure(g_config_dic['open_time_sec'], g_config_dic['close_time_sec'], g_config_dic['overtravel_percent'] / 100)
 
 # 設定ファイル読み込み
 def load_config():
-    global g_config_dic, g_ope_time_dic
-    try:
-        with open(CONFIG_JSON_FILE, 'r') as f:
-            g_config_dic = json.load(f)
-    except OSError:
-        with open(CONFIG_JSON_FILE, 'w') as f:
-            json.dump(g_config_dic, f, separators=(',', ': '))
+    global g_ope_time_dic
+    errors = CONFIG.load()
+    if errors:
+        logger(f"設定ファイル不正 (既定値を使用): {errors}")
 
     try:
         with open(OPE_TIME_JSON_FILE, 'r') as f:
@@ -92,6 +214,20 @@ def load_config():
         with open(OPE_TIME_JSON_FILE, 'w') as f:
             json.dump(g_ope_time_dic, f, separators=(',', ': '))
 
+    configure_gate()
+    compile_schedule()
+
+# 設定変更の反映
+def on_config_changed(key, value):
+    logger(f"設定変更: {key} = {value}")
+    event(EV_CONFIG)
+    if key.startswith('ope_time_'):
+        compile_schedule()
+    elif key in ('open_time_sec', 'close_time_sec', 'overtravel_percent'):
+        configure_gate()
+
+CONFIG.subscribe(on_config_changed)
+
 def zfill(s, width):
     if len(s) < width:
         return ("0" * (width - len(s))) + s
@@ -103,345 +239,610 @@ g_ope_time_dic = [
     for i in range(8)
 ]
 
-def ensure_log_dir():
-    if LOG_DIR not in uos.listdir('/'):
-        try:
-            uos.mkdir(LOG_DIR)
-        except:
-            pass
-
-def get_log_filename():
-    t = utime.localtime()
-    return f"{LOG_DIR}/log_{t[0]:04d}{t[1]:02d}{t[2]:02d}.txt"
-
-def delete_old_logs():
-    try:
-        files = uos.listdir(LOG_DIR)
-        now = utime.time()
-
-        for fname in files:
-            if fname.startswith("log_") and fname.endswith(".txt"):
-                try:
-                    y = int(fname[4:8])
-                    m = int(fname[8:10])
-                    d = int(fname[10:12])
-                    log_time = utime.mktime((y, m, d, 0, 0, 0, 0, 0))
-                    if now - log_time > LOG_RETAIN_DAYS * 86400:
-                        uos.remove(f"{LOG_DIR}/{fname}")
-                        print(f"削除: {fname}")
-                except Exception as e:
-                    print("ログファイル日付解析エラー:", fname, e)
-    except Exception as e:
-        print("ログ削除処理エラー:", e)
-
-
 # ログ出力
-# def logger(msg):
-#     try:
-#         _dateTime = fromatDateTimeStr(utime.localtime())
-#         formated_msg = f"{_dateTime} {msg}\n"
-#         if g_ble_ope_mode == BLE_MODE_LOG:
-#             BLE_SP.send(formated_msg.strip())
-#             
-#         with open(LOG_FILE, 'a') as f:  # ファイルを追記モードで開く
-#             f.write(formated_msg.strip())    # 追記実行（文字列で）※改行付
-#             #print("Append:", data)  # 追記データ表示
-#             
-#         print(formated_msg.strip())
-#     except Exception as e:
-#         print('logger error:' + str(e))
-# 新しい logger
+# ファイルへの書き出しは LOG のフラッシュタスクがまとめて行う
+# 行は LOG_LINE に組み立てる (msg は str / bytes / TextBuf.view())
+LOG_LINE = TextBuf(256)
+
+@PROF.timed('logger')
 def logger(msg):
     try:
-        _dateTime = fromatDateTimeStr(utime.localtime())
-        formated_msg = f"{_dateTime} {msg}\n"
+        line = LOG_LINE.clear().add(CLOCK.stamp()).byte(0x20).add(msg).view()
 
         # BLEに送信
         if g_ble_ope_mode == BLE_MODE_LOG:
-            BLE_SP.send(formated_msg.strip())
-
-        ensure_log_dir()
-        delete_old_logs()
-
-        # 日付ごとのファイルに書き出す
-        with open(get_log_filename(), 'a') as f:
-            f.write(formated_msg)
+            BLE_SP.send(line)
 
-        print(formated_msg.strip())
+        LOG.write(line)
+        print(str(line, 'utf-8'))
     except Exception as e:
         print('logger error:' + str(e))
 
-# RTC設定
+# バイナリログにイベントを記録する (値は水位・秒数などイベントごとの数値)
+def event(code, value=0, level=INFO):
+    BINLOG.write(TIME.time(), code, value, level, g_open_close)
+
+# ログをフラッシュしてからリセット
+def flush_and_reset():
+    checkpoint()
+    CONFIG.save_now()
+    LOG.flush()
+    reset()
+
+# RTC設定 (DS1307 の UTC をエポック秒で JST にして TIME と内蔵 RTC に設定する)
+# 以降は TIME.run() が秒の変わり目で定期的に合わせ直す
 def set_rtc():
     try:
         logger('rtc connect')
-        _i2c_rtc = SoftI2C(scl=Pin(1), sda=Pin(0), freq=100000)
-        _rtc = DS1307(_i2c_rtc)
         logger('datetime setting')
-        #RTC().datetime(_rtc.datetime())
-        # JST = UTC + 9 時間
-        ds_time = list(_rtc.datetime())
-        ds_time[4] += 9  # index 4 = hour
-        if ds_time[4] >= 24:
-            ds_time[4] -= 24
-            ds_time[2] += 1  # 日を1日進める（簡易的、月超えには非対応）
-
-        RTC().datetime(tuple(ds_time))
+        TIME.sync_now()
     except Exception as e:
         logger(f"RTC初期化エラー: {str(e)}")
         logger("RTC未接続または無効。内蔵タイマーを使用します。時刻の正確性が保証されません。")
 
+# 運転状態を DS1307 の RAM に残す (内容が変わった時だけ書く。フラッシュには書かない)
+# 目標へ向かっている途中は「動作中」として残し、復元時に位置を使わない
+# 位置が分かるまで (起動時の閉門が終わるまで) は書かない。残っている記録は無効か動作中なので次の起動も閉門する
+# 変化が無くても restore_max_age_sec の半分ごとに記録時刻を書き直す (止まっている門の記録を古くしない)
+def checkpoint():
+    if not (g_restored or HOMED.is_set()):
+        return
+    CHECKPOINT.save(
+        GATE.position,
+        GATE.target,
+        g_open_close,
+        MODE_CODES.get(g_ble_ope_mode, 0),
+        GATE.moving() or GATE.target != GATE.position,
+        g_count_down_until_closing,
+        g_water_level,
+        g_restores,
+        TIME.time(),
+        g_config_dic["restore_max_age_sec"] // 2,
+    )
+
+# 起動時に DS1307 の RAM から運転状態を戻す。止まっていた門の位置が分かれば起動時の閉門を省く
+def restore_state():
+    global g_open_close, g_count_down_until_closing, g_water_level, g_restored, g_restores
+    state = CHECKPOINT.load()
+    if state is None:
+        logger("状態の記録なし (起動時に閉門)")
+        return
+    mode = MODE_NAMES.get(state.mode)
+    if mode != BLE_MODE_TEST:
+        set_mode(mode)
+    g_water_level = state.level_cm
+    age = TIME.time() - state.time
+    if state.moving:
+        logger(f"状態の記録は動作中 (起動時に閉門) {age}秒前")
+        return
+    if not 0 <= age <= g_config_dic["restore_max_age_sec"]:
+        logger(f"状態の記録が古い (起動時に閉門) {age}秒前")
+        return
+    if state.restores >= g_config_dic["restore_max_count"]:
+        logger(f"状態の記録は {state.restores} 回続けて復元済み (起動時に閉門)")
+        return
+    GATE.restore(state.position)
+    g_open_close = state.gate
+    g_count_down_until_closing = state.countdown_sec
+    g_restored = True
+    g_restores = state.restores + 1
+    logger(f"状態復元: {GATE.percent()}% {'開門' if g_open_close == OPENCLOSE_OPEN else '閉門'} {mode} {age}秒前 {g_restores}回目")
+
 
 
 
 # 運用時間チェック
+# 次の切替時刻まで (または時間帯の変更まで) 眠り、切替時だけ記録する
 async def check_drive_times():
     global g_is_drive_times
+    sub = Subscriber(T_SCHEDULE)
     while True:
-        _, current_time = getDateTime(utime.localtime())
-        logger('運用時間帯チェック')
-        g_is_drive_times = False
-        for item in g_ope_time_dic:
-            if item['start_time'] <= current_time < item['end_time']:
-                g_is_drive_times = g_config_dic.get('ope_time_' + str(item['id']), False)
-        logger(f"現在の時間＝{current_time}")
-        logger(f"運用時間帯か？＝{g_is_drive_times}")
-        await asyncio.sleep(3)
+        t = CLOCK.localtime()
+        is_drive_times = SCHEDULE.is_active(t)
+        if is_drive_times != g_is_drive_times:
+            logger(f"運用時間帯切替＝{is_drive_times} ({CLOCK.hhmm()})")
+            g_is_drive_times = is_drive_times
+            event(EV_DRIVE_TIMES, is_drive_times)
+            T_DRIVE_TIMES.publish(is_drive_times)
+        await P_DRIVE_TIMES.wait(sub, SCHEDULE.seconds_until_next(t) or 86400)
+
+# 運用時間帯をコンパイルし、check_drive_times を起こす
+def compile_schedule():
+    SCHEDULE.compile(g_ope_time_dic, g_config_dic)
+    T_SCHEDULE.publish()
+
+# 周期的な行をテキストログに書くか (種類ごとに前回書いた時刻と水位を覚える)
+g_periodic_log = {}
+
+def periodic_log_due(kind, level=0.0):
+    now = utime.ticks_ms()
+    last = g_periodic_log.get(kind)
+    if last and utime.ticks_diff(now, last[0]) < LOG_PERIODIC_MS and abs(level - last[1]) < LOG_LEVEL_DELTA_CM:
+        return False
+    g_periodic_log[kind] = (now, level)
+    return True
+
+# 周期処理のログの定型部分
+_M_MEASURE = '測定 '.encode()
+_M_NO_ECHO = '測定 エコーなし'.encode()
+_M_LEVEL = b'cm (g_water_level): '
+_M_AUTO = '自動モード'.encode()
+_M_OPEN_OK = 'open条件成立'.encode()
+_M_CLOSE_OK = 'close条件成立'.encode()
+MSG = TextBuf(64)
+
+# 周期タスクの期限 (処理時間が周期に積み重ならない)
+ULTRA_TICK = Periodic()
+STATUS_TICK = Periodic()
 
 # 水位測定
+# 1 回の測定ごとにフィルタを更新し、g_water_level を最新の推定値にする
+# 測定の直後が次の測定まで最も余裕があるので、ここで必要なら GC する
 async def ultra():
-    global g_water_level
     logger(f"測定開始")
+    ULTRA_TICK.reset()
     while True:
-        
-        _values = []
-        for _ in range(3):
-            TRIG.low()
-            utime.sleep_us(10)
-            TRIG.high()
-            utime.sleep_us(2)
-            TRIG.low()
-            k = 0
-            while ECHO.value() == 0:
-                signaloff = utime.ticks_us()
-                k += 1
-                if k > 10000:
-                    break
-            k = 0
-            while ECHO.value() == 1:
-                signalon = utime.ticks_us()
-                k += 1
-                if k > 10000:
-                    break
-            timepassed = signalon - signaloff
-            distance = round((timepassed * 0.0343) / 2, 1)
-            logger(f"測定 {distance}cm")
-            _values.append(distance)
-            await asyncio.sleep(3)
-        g_water_level = get_clustered_values_average(_values)
-        logger(f"測定(g_water_level): {g_water_level}")
-        await asyncio.sleep(3)
-
-# クラスタ化平均
-def get_clustered_values_average(data):
-    try:
-        if not data:
-            return 0
-        sorted_data = sorted(data)
-        threshold = 5
-        clusters = []
-        current = [sorted_data[0]]
-        for i in range(1, len(sorted_data)):
-            if sorted_data[i] - sorted_data[i-1] <= threshold:
-                current.append(sorted_data[i])
-            else:
-                clusters.append(current)
-                current = [sorted_data[i]]
-        clusters.append(current)
-        max_cluster = max(clusters, key=len)
-        return round(sum(max_cluster) / len(max_cluster), 1)
-    except Exception as e:
-        logger(str(e))
-        return 0
-
+        await measure_level()
+        await P_ULTRA.sleep_ms(ULTRA_TICK.delay_ms(g_config_dic["measure_interval_sec"] * 1000))
 
-# 水門開ける
-async def wopen(sec=10):
-    global g_open_close, g_count_down_until_closing
-    if g_open_close == OPENCLOSE_OPEN:
+# 測定 1 回分 (測定・フィルタ・記録・通知・空き時間の GC)。ベンチマークもこれを計る
+async def measure_level():
+    global g_water_level
+    distance = await SONAR.distance_cm()
+    if distance is None:
+        if periodic_log_due('no_echo'):
+            logger(_M_NO_ECHO)
+        event(EV_NO_ECHO, 0, WARN)
+    else:
+        g_water_level = round(LEVEL.push(distance), 1)
+        boot_once('first_level')
+        if periodic_log_due('measure', g_water_level):
+            logger(MSG.clear().add(_M_MEASURE).fixed(distance, 1).add(_M_LEVEL).fixed(g_water_level, 1).view())
+        event(EV_LEVEL, g_water_level)
+        T_LEVEL.publish(g_water_level)
+    PROF.idle_collect(HEAP_MIN_FREE)
+
+
+# 水門開ける (percent: 開度 %)
+# 動作は GATE のタスクが行うので待たない。閉じている途中でも向きを変えて開ける
+def wopen(percent=100, stamp=None):
+    global g_open_close, g_count_down_until_closing, g_close_at
+    target = percent / 100
+    if g_open_close == OPENCLOSE_OPEN and GATE.target == target:
         return
     g_open_close = OPENCLOSE_OPEN
     g_count_down_until_closing = g_config_dic.get("wait_before_closing_sec", 120)
-    logger(f'watergate open: {sec} sec')
-    M1.low()
-    M2.high()
-    await asyncio.sleep(sec)
-    M1.low()
-    M2.low()
-    await asyncio.sleep(5)
+    g_close_at = None
+    logger(f'watergate open: {percent}% (現在 {GATE.percent()}%)')
+    event(EV_OPEN, percent)
+    GATE.move_to(target, stamp)
+    checkpoint()
 
 # 水門閉じる
-async def wclose(sec=20):
+def wclose(stamp=None):
     global g_open_close
-    if g_open_close == OPENCLOSE_CLOSE:
+    if g_open_close == OPENCLOSE_CLOSE and GATE.target == 0:
         return
     g_open_close = OPENCLOSE_CLOSE
-    logger(f'watergate close: {sec} sec')
-    M1.high()
-    M2.low()
-    await asyncio.sleep(sec)
-    M1.low()
-    M2.low()
-    await asyncio.sleep(5)
+    logger(f'watergate close (現在 {GATE.percent()}%)')
+    event(EV_CLOSE, GATE.percent())
+    GATE.move_to(0, stamp)
+    checkpoint()
+
 # ステータス送信
 async def show_status_service():
+    STATUS_TICK.reset()
     while True:
-        await asyncio.sleep(g_config_dic["waiting_for_interval_sec"])
+        await P_STATUS.sleep_ms(STATUS_TICK.delay_ms(g_config_dic["waiting_for_interval_sec"] * 1000))
         show_status()
 
+# ステータス文の定型部分
+_ST_LEVEL = '現在水位'.encode()
+_ST_THRESHOLD = 'cm 閾値'.encode()
+_ST_MODE = {
+    BLE_MODE_FORCE: 'cm 強制 '.encode(),
+    BLE_MODE_AUTO: 'cm 自動 '.encode(),
+}
+_ST_MANUAL = 'cm 手動 '.encode()
+_ST_OPEN = '開門'.encode()
+_ST_CLOSE = '閉門'.encode()
+_ST_DRIVE = '% 運中帯 '.encode()
+_ST_STOP = '% 運止帯 '.encode()
+STATUS_TEXT = TextBuf(96)
+
 def show_status():
-    _, current_time = getDateTime(utime.localtime())
-    mode = {
-        BLE_MODE_FORCE: '強制',
-        BLE_MODE_AUTO: '自動',
-    }.get(g_ble_ope_mode, '手動')
-    msg = f"現在水位{round(g_config_dic['water_level_correction_mm'] - g_water_level, 1)}cm 閾値{g_config_dic['open_closing_standards_mm']}cm {mode} {'開門' if g_open_close == OPENCLOSE_OPEN else '閉門'} {'運中帯' if g_is_drive_times else '運止帯'} {current_time}"
-    BLE_SP.send(msg.strip())
-    logger(msg.strip())
-
-# 時刻フォーマット
-def fromatDateTimeStr(localTIme):
-    Y, M, D, hr, m, s, _, _ = localTIme
-    return f"{Y:04}/{M:02}/{D:02} {hr:02}:{m:02}:{s:02}"
-
-def getDateTime(localTIme):
-    Y, M, D, hr, m, _, _, _ = localTIme
-    return f"{Y:04}/{M:02}/{D:02}", f"{hr:02}:{m:02}"
+    msg = STATUS_TEXT.clear().add(_ST_LEVEL).fixed(get_current_water_level(), 1) \
+        .add(_ST_THRESHOLD).int(g_config_dic['open_closing_standards_mm']) \
+        .add(_ST_MODE.get(g_ble_ope_mode, _ST_MANUAL)) \
+        .add(_ST_OPEN if g_open_close == OPENCLOSE_OPEN else _ST_CLOSE).int(GATE.percent()) \
+        .add(_ST_DRIVE if g_is_drive_times else _ST_STOP).add(CLOCK.hhmm_bytes()).view()
+    BLE_SP.send(msg)
+    if periodic_log_due('status', get_current_water_level()):
+        logger(msg)
+    event(EV_STATUS, get_current_water_level())
+    BLE_SP.set_status(STATUS_FRAME.pack(
+        get_current_water_level(),
+        g_config_dic['open_closing_standards_mm'],
+        g_ble_ope_mode,
+        g_open_close,
+        g_is_drive_times,
+        g_count_down_until_closing,
+        UPTIME.update(),
+    ))
+    update_adv_status()
+    checkpoint()
+
+def update_adv_status():
+    if ADV_STATUS.pack(
+        get_current_water_level(),
+        GATE.percent(),
+        g_ble_ope_mode,
+        g_open_close,
+        g_is_drive_times,
+        GATE.moving(),
+        g_config_dic['open_closing_standards_mm'],
+        g_count_down_until_closing,
+    ):
+        BLE_SP.set_adv_status(ADV_STATUS.adv, ADV_STATUS.detail)
+
 # auto_drive 修正
 def get_current_water_level():
     return g_config_dic['water_level_correction_mm'] - g_water_level
 
+# LCD の表示内容
+#   0 行目: 水位 閾値 モード       "L  8.1 T  7 AUTO"
+#   1 行目: 水位の棒グラフ 門 開度 運用時間帯 "######     O100*"
+_LCD_MODES = {
+    BLE_MODE_AUTO: b'AUTO',
+    BLE_MODE_FORCE: b'FORC',
+    BLE_MODE_SELF: b'SELF',
+    BLE_MODE_LOG: b'LOG',
+    BLE_MODE_MENU: b'MENU',
+    BLE_MODE_CONFIGURE: b'CONF',
+    BLE_MODE_TEST: b'TEST',
+}
+LCD_TEXT = TextBuf(8)
+
+def draw_lcd():
+    v = LCD_VIEW
+    wl = get_current_water_level()
+    v.put(0, 0, b'L')
+    v.put(0, 1, LCD_TEXT.clear().fixed(wl, 1).view(), 5, True)
+    v.put(0, 6, b' T')
+    v.put(0, 8, LCD_TEXT.clear().int(g_config_dic['open_closing_standards_mm']).view(), 3, True)
+    v.put(0, 11, b' ')
+    v.put(0, 12, _LCD_MODES.get(g_ble_ope_mode, b'----'), 4)
+    v.bar(1, 0, 10, wl / LCD_BAR_CM)
+    v.put(1, 10, b' O' if g_open_close == OPENCLOSE_OPEN else b' C')
+    v.put(1, 12, LCD_TEXT.clear().int(GATE.percent()).view(), 3, True)
+    v.put(1, 15, b'*' if g_is_drive_times else b' ')
+    v.update()
+
+# 入力が変わった時と 1 秒ごと (動作中の開度) に描き直す。画面への書き込みは LCD_VIEW が差分だけ行う
+async def lcd_service():
+    sub = Subscriber(T_LEVEL, T_MODE, T_DRIVE_TIMES, T_FORCE)
+    while True:
+        draw_lcd()
+        await sub.wait(1)
+
+# LCD があれば表示を始める
+def start_lcd():
+    global LCD_VIEW
+    try:
+        LCD_VIEW = LcdView(I2cLcd(I2C_BUS, LCD_ADDR, LCD_LINES, LCD_COLUMNS), LCD_MIN_INTERVAL_MS)
+    except OSError:
+        logger("LCD未接続")
+        return
+    LCD_VIEW.flush_row = PROF.timed('lcd_row')(LCD_VIEW.flush_row)
+    asyncio.create_task(LCD_VIEW.run())
+    asyncio.create_task(lcd_service())
+
 # 自動運転
+# 水位・運用時間帯・モードが変わった時に判定する
+# 閉門待ちは数え始めた時に期限 (g_close_at) を決め、残りは期限から求める (判定の間隔で丸めない)
+# 判定は水位の通知ごとに行うが、ログには判定の結果が変わった時だけ書く
 async def auto_drive():
-    global g_is_drive_times, g_open_close, g_count_down_until_closing
+    global g_is_drive_times, g_open_close, g_count_down_until_closing, g_close_at
+    sub = Subscriber(T_LEVEL, T_DRIVE_TIMES, T_MODE)
+    await HOMED.wait()
+    logged = None  # 最後にログに書いた判定 (門, 開ける条件)
     while True:
-        await asyncio.sleep(g_config_dic["waiting_for_interval_sec"])
-        if g_ble_ope_mode == BLE_MODE_AUTO:
-            _, _current_time = getDateTime(utime.localtime())
-            logger("自動モード")
-            wl = get_current_water_level()
-            if g_open_close == OPENCLOSE_CLOSE:
-                if (g_is_drive_times and wl < g_config_dic['open_closing_standards_mm']) or \
-                   (not g_is_drive_times and wl < 4):
-                    logger('open条件成立')
-                    await wopen(g_config_dic['open_time_sec'])
-                else:
-                    logger('close条件成立')
-                    pass
-
-            elif g_open_close == OPENCLOSE_OPEN:
-                if (g_is_drive_times and wl < g_config_dic['open_closing_standards_mm']) or \
-                   (not g_is_drive_times and wl < 4):
-                    logger('open条件成立')
-                    pass
-                else:
-                    logger('close条件成立')
-                    if g_count_down_until_closing > 0:
-                        g_count_down_until_closing -= g_config_dic["waiting_for_interval_sec"]
+        timeout = None
+        if g_close_at is not None:
+            timeout = max(0, utime.ticks_diff(g_close_at, utime.ticks_ms())) / 1000
+        woke = await P_AUTO.wait(sub, timeout)
+        # 判定遅延は publish で起きた時だけ記録する (閉門の期限で起きた時の source は前回の通知)
+        if woke and sub.source:
+            DECISION_LATENCY.record(sub.source.stamp)
+            sub.source = None
+        if g_ble_ope_mode != BLE_MODE_AUTO:
+            g_close_at = None
+            logged = None
+            continue
+        wl = get_current_water_level()
+        want_open = (g_is_drive_times and wl < g_config_dic['open_closing_standards_mm']) or \
+                    (not g_is_drive_times and wl < 4)
+        quiet = logged == (g_open_close, want_open)
+        logged = (g_open_close, want_open)
+        if not quiet:
+            logger(_M_AUTO)
+        if g_open_close == OPENCLOSE_CLOSE:
+            g_close_at = None
+            if want_open:
+                logger(f'open条件成立 (判定遅延 {DECISION_LATENCY.last}ms)')
+                wopen()
+                await GATE.wait_idle()  # 自動運転では自分の動作を途中で反転させない
+            elif not quiet:
+                logger(_M_CLOSE_OK)
+
+        elif g_open_close == OPENCLOSE_OPEN:
+            if want_open:
+                g_close_at = None
+                if not quiet:
+                    logger(_M_OPEN_OK)
+            else:
+                if not quiet:
+                    logger(_M_CLOSE_OK)
+                now_ms = utime.ticks_ms()
+                if g_close_at is None:
+                    g_close_at = utime.ticks_add(now_ms, g_count_down_until_closing * 1000)
+                remain_ms = utime.ticks_diff(g_close_at, now_ms)
+                g_count_down_until_closing = max(0, (remain_ms + 999) // 1000)
+                if remain_ms > 0:
+                    if not quiet:
                         logger(f"閉門可能まであと {g_count_down_until_closing} 秒")
+                else:
+                    if woke:
+                        logger(f'close実行 (判定遅延 {DECISION_LATENCY.last}ms)')
                     else:
-                        logger('close実行')
-                        await wclose(g_config_dic['close_time_sec'])
-
+                        logger(f'close実行 (期限から {-remain_ms}ms)')
+                    g_close_at = None
+                    wclose()
+                    await GATE.wait_idle()
+
+
+# 強制スイッチ (割り込みで確定した変化ごとに呼ばれる)
+# 実行中の動作やコマンドより優先し、その場で水門を向け直す
+def on_force(state, stamp):
+    T_FORCE.publish(state)
+    open_on = state[0] == FORCE_OPEN_ON
+    close_on = state[1] == FORCE_CLOSE_ON
+    if not (open_on or close_on):
+        logger("強制スイッチ解除")
+        return
+    set_mode(BLE_MODE_FORCE)
+    COMMANDS.clear()
+    logger(f"強制スイッチ {'開' if open_on else '閉'}")
+    if open_on:
+        wopen(stamp=stamp)
+    else:
+        wclose(stamp=stamp)
+
+FORCE_SW.subscribe(on_force)
+
+# モーター始動 (強制スイッチの押下からの遅延を記録)
+def on_gate_start(direction, stamp):
+    FORCE_LATENCY.record(stamp)
+    logger(f"強制 押下→モーター始動 {FORCE_LATENCY.last}ms (最大 {FORCE_LATENCY.max}ms)")
+
+GATE.subscribe(on_gate_start)
+
+# 運転モード変更
+def set_mode(mode):
+    global g_ble_ope_mode
+    if g_ble_ope_mode != mode:
+        g_ble_ope_mode = mode
+        event(EV_MODE, MODE_CODES.get(mode, 0))
+        T_MODE.publish(mode)
+        update_adv_status()
+        checkpoint()
+
+# 実行状況を BLE に出力する
+def send_stats():
+    for line in PROF.report(UPTIME.update()):
+        BLE_SP.send(line)
+    BLE_SP.send(f"ble sent={BLE_SP.tx_sent} dropped={BLE_SP.tx_dropped} retries={BLE_SP.tx_retries} log_dropped={LOG.dropped} rx_dropped={BLE_RX.rejected} adv={BLE_SP.adv_updates}/{BLE_SP.adv_errors}")
+    BLE_SP.send(f"latency decision={DECISION_LATENCY.avg()}/{DECISION_LATENCY.max}ms force={FORCE_LATENCY.avg()}/{FORCE_LATENCY.max}ms")
+    BLE_SP.send(f"gate {GATE.percent()}% on_ms={GATE.on_ms_open}/{GATE.on_ms_close} starts={GATE.starts} reversals={GATE.reversals} restored={g_restored}/{g_restores}")
+    BLE_SP.send(f"checkpoint writes={CHECKPOINT.writes} errors={CHECKPOINT.errors}")
+    if LCD_VIEW:
+        BLE_SP.send(f"lcd frames={LCD_VIEW.frames} runs={LCD_VIEW.runs} chars={LCD_VIEW.chars} errors={LCD_VIEW.errors}")
+    BLE_SP.send(f"time syncs={TIME.syncs} errors={TIME.errors} step_ms={TIME.last_step_ms} drift_ppm={TIME.drift_ppm:.1f} max={TIME.max_drift_ppm:.1f} skipped={ULTRA_TICK.skipped}/{STATUS_TICK.skipped}")
+
+# 過去ログのダウンロード (BLE)
+LOG_XFER = LogTransfer(BLE_SP, LOG_DIR, logger, store=LOG_RING)
 
 # BLE受信
-
+# on_rx は BLE の IRQ からスケジュールされ、タスクの処理の途中にも割り込む
+# 記録 (LOG_LINE, LogSink) やモード変更・出力はタスク側と競合するので、ここでは受信キューに積むだけにして
+# ble_rx タスクで処理する (過去ログ転送の受信確認は転送状態を更新するだけなので直接渡す)
 def on_rx(data):
-    global g_ble_ope_mode, g_ble_commands
     cmd = data.strip()
+    # 過去ログ転送の受信確認は記録しない
+    if cmd.startswith(b'ack '):
+        LOG_XFER.command(cmd)
+        return
+    if BLE_RX.put(None, cmd):
+        BLE_RX_FLAG.set()
+
+async def ble_rx():
+    while True:
+        await BLE_RX_FLAG.wait()
+        await BLE_RX.drain(on_error=on_command_error)
+
+async def handle_rx(cmd):
     logger(f"BLE RX: {cmd}")
+    boot_once('first_cmd')
+    event(EV_BLE_CMD, len(cmd))
     if cmd == b'log':
-        g_ble_ope_mode = BLE_MODE_LOG
+        set_mode(BLE_MODE_LOG)
     elif cmd == b'reset':
-        reset()
+        flush_and_reset()
     elif cmd == b'self':
-        g_ble_ope_mode = BLE_MODE_SELF
+        set_mode(BLE_MODE_SELF)
     elif cmd == b'menu':
-        g_ble_ope_mode = BLE_MODE_MENU
+        set_mode(BLE_MODE_MENU)
     elif cmd == b'configure':
-        g_ble_ope_mode = BLE_MODE_CONFIGURE
+        set_mode(BLE_MODE_CONFIGURE)
+    elif cmd == b'stats':
+        send_stats()
+    elif LOG_XFER.command(cmd):
+        pass
     else:
         if g_ble_ope_mode in [BLE_MODE_CONFIGURE, BLE_MODE_MENU, BLE_MODE_TEST, BLE_MODE_SELF]:
-            g_ble_commands.append({
-                'mode': g_ble_ope_mode,
-                'command': cmd,
-                'timestamp': fromatDateTimeStr(utime.localtime())
-            })
+            if not COMMANDS.put(g_ble_ope_mode, cmd):
+                logger(f"コマンド破棄 (キュー満杯): {cmd}")
+    T_BLE_CMD.publish(cmd)
+
+# BLE コマンド処理
+# 予約中の変更をすぐに書き出す (変更が無ければ書かない)
+async def cmd_save(cmd):
+    CONFIG.save_now()
+
+async def cmd_configure(cmd):
+    if b'=' in cmd:
+        try:
+            kv = cmd.decode().split('=', 1)
+            CONFIG.set(kv[0].strip(), kv[1])
+        except (KeyError, ValueError, TypeError):
+            logger(f"設定エラー: {cmd}")
+    else:
+        try:
+            key = cmd.decode()
+        except UnicodeError:
+            logger(f"設定エラー: {cmd}")
+            return
+        logger(f"参照: {key} = {g_config_dic.get(key, '??')}")
+
+async def cmd_open(cmd):
+    wopen()
+
+async def cmd_close(cmd):
+    wclose()
+
+async def cmd_stop(cmd):
+    GATE.stop()
+    checkpoint()
+    logger(f"停止 ({GATE.percent()}%)")
+
+# open <開度%>
+async def cmd_open_percent(cmd):
+    args = cmd.split()
+    try:
+        if len(args) != 2 or args[0] != b'open':
+            raise ValueError
+        percent = int(args[1])
+    except ValueError:
+        on_command_unknown(BLE_MODE_SELF, cmd)
+        return
+    wopen(max(0, min(100, percent)))
+
+def on_command_done(mode, cmd, ms):
+    logger(f"処理: {mode} {cmd} ({ms}ms)")
+
+def on_command_unknown(mode, cmd):
+    logger(f"未対応コマンド: {mode} {cmd}")
+
+def on_command_error(mode, cmd, e):
+    logger(f"コマンドエラー: {mode} {cmd} {type(e).__name__} {e}")
+    event(EV_ERROR, 0, ERROR)
+
+COMMANDS.register(BLE_MODE_CONFIGURE, b'save', cmd_save)
+COMMANDS.register(BLE_MODE_CONFIGURE, None, cmd_configure)
+COMMANDS.register(BLE_MODE_SELF, b'open', cmd_open)
+COMMANDS.register(BLE_MODE_SELF, b'close', cmd_close)
+COMMANDS.register(BLE_MODE_SELF, b'stop', cmd_stop)
+COMMANDS.register(BLE_MODE_SELF, None, cmd_open_percent)
+BLE_RX.register(None, None, handle_rx)
+
+# 起動の段階の初回だけ記録する
+def boot_once(name):
+    ms = BOOT.once(name)
+    if ms is not None:
+        logger(f"起動 {name}: {ms}ms")
+
+# 起動時の閉門 (バックグラウンド)。位置を復元できた場合は閉門せずに完了とする
+async def home():
+    if not g_restored:
+        wclose()
+        await GATE.wait_idle()
+    BOOT.mark('homed')
+    HOMED.set()
+    checkpoint()
+    logger(f"起動完了: {BOOT.report()}")
+    # 起動時から押されている強制スイッチは変化が無いので通知されない。起動が済んだらここで反映する
+    # (押下の時刻は分からないので始動までの遅延は記録しない)
+    if FORCE_SW.state != (FORCE_OPEN_OFF, FORCE_CLOSE_OFF) and g_ble_ope_mode != BLE_MODE_FORCE:
+        on_force(FORCE_SW.state, None)
 
 # メイン関数
+# 起動は ログ → 時刻・設定 → BLE 受信 → 測定・運用時間帯 の順に数 ms で済ませ、
+# 時間のかかる閉門は最後にバックグラウンドで行う
 async def main():
+    LOG_RING.open()
+    asyncio.create_task(GATE.run())
+    asyncio.create_task(LOG.run())
+    asyncio.create_task(BLE_SP.tx_task())
+    asyncio.create_task(CONFIG.run())
+    asyncio.create_task(LOG_XFER.run())
     logger('start')
+    event(EV_BOOT)
+    BOOT.mark('log')
     set_rtc()
+    asyncio.create_task(TIME.run())
     load_config()
-    await wclose(g_config_dic['close_time_sec'])
+    restore_state()
+    BOOT.mark('config')
+    asyncio.create_task(ble_rx())
     BLE_SP.on_write(on_rx)
+    BOOT.mark('ble')
     asyncio.create_task(ultra())
     asyncio.create_task(check_drive_times())
-    asyncio.create_task(auto_drive())
     asyncio.create_task(show_status_service())
-    global g_count_down_since_opening, g_ble_ope_mode
+    asyncio.create_task(FORCE_SW.run())
+    BOOT.mark('sensing')
+    start_lcd()
+    BOOT.mark('lcd')
+    asyncio.create_task(home())
+    asyncio.create_task(auto_drive())
+    sub = Subscriber(T_FORCE, T_BLE_CMD, T_MODE)
 
     while True:
-        await asyncio.sleep(g_config_dic["waiting_for_interval_sec"])
+        # 手動系モードは一定時間コマンドが無ければ自動に戻す
+        if g_ble_ope_mode in [BLE_MODE_LOG, BLE_MODE_AUTO]:
+            await P_MAIN.wait(sub)
+            woke = True
+        else:
+            woke = await P_MAIN.wait(sub, g_config_dic["waiting_for_interval_sec"])
         if g_water_level is None:
             continue
-        if FORCE_OPEN.value() == FORCE_OPEN_ON:
-            g_ble_ope_mode = BLE_MODE_FORCE
-            g_ble_commands.clear()
-            await wopen(g_config_dic['open_time_sec'])
-            continue
-        if FORCE_CLOSE.value() == FORCE_CLOSE_ON:
-            g_ble_ope_mode = BLE_MODE_FORCE
-            g_ble_commands.clear()
-            await wclose(g_config_dic['close_time_sec'])
+        # 強制スイッチの操作は on_force で済んでいる。押されている間は自動に戻さない
+        if FORCE_SW.state != (FORCE_OPEN_OFF, FORCE_CLOSE_OFF):
             continue
-        if g_ble_commands:
-            g_ble_commands.sort(key=lambda x: x['timestamp'])
-            command = g_ble_commands.pop(0)
-            logger(f"処理: {command}")
-            if command['mode'] == BLE_MODE_CONFIGURE:
-                g_count_down_since_opening = 0
-                if command['command'] == b'save':
-                    with open(CONFIG_JSON_FILE, 'w') as f:
-                        json.dump(g_config_dic, f, separators=(',', ': '))
-                elif b'=' in command['command']:
-                    kv = command['command'].decode().split('=')
-                    if kv[0] in g_config_dic:
-                        try:
-                            g_config_dic[kv[0]] = type(g_config_dic[kv[0]])(eval(kv[1]))
-                        except:
-                            logger(f"設定エラー: {kv}")
-                else:
-                    logger(f"参照: {command['command']} = {g_config_dic.get(command['command'], '??')}")
-            elif command['mode'] == BLE_MODE_SELF:
-                if command['command'] == b'open':
-                    await wopen(g_config_dic['open_time_sec'])
-                elif command['command'] == b'close':
-                    await wclose(g_config_dic['close_time_sec'])
-            g_count_down_since_opening = 0
+        if len(COMMANDS):
+            await COMMANDS.drain(on_command_done, on_command_unknown, on_command_error)
         elif g_ble_ope_mode == BLE_MODE_TEST:
-            await wopen(g_config_dic['open_time_sec'])
-            await wclose(g_config_dic['close_time_sec'])
-            g_count_down_since_opening = 0
-            g_ble_ope_mode = BLE_MODE_AUTO
-        elif g_ble_ope_mode not in [BLE_MODE_LOG, BLE_MODE_AUTO]:
-            g_ble_ope_mode = BLE_MODE_AUTO
-
-# 実行
-try:
-    asyncio.run(main())
-except Exception as e:
-    logger(str(e))
-finally:
-    utime.sleep(5)
-    reset()
+            await HOMED.wait()
+            wopen()
+            await GATE.wait_idle()
+            # 強制スイッチで中断された場合はそのまま
+            if g_ble_ope_mode == BLE_MODE_TEST:
+                wclose()
+                await GATE.wait_idle()
+                set_mode(BLE_MODE_AUTO)
+        elif g_ble_ope_mode not in [BLE_MODE_LOG, BLE_MODE_AUTO] and not woke:
+            set_mode(BLE_MODE_AUTO)
+
+# 実行 (起動時の main.py として実行された場合のみ。import した場合はベンチマーク等から関数を使う)
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        logger(str(e))
+        event(EV_ERROR, 0, ERROR)
+    finally:
+        checkpoint()
+        CONFIG.save_now()
+        LOG.flush()
+        utime.sleep(5)
+        reset()
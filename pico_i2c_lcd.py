@@ -11,6 +11,9 @@ MASK_E  = 0x04       # P2
 SHIFT_BACKLIGHT = 3  # P3
 SHIFT_DATA      = 4  # P4-P7
 
+# Bytes per transfer: each LCD byte is sent as two nibbles, each strobed with E
+BATCH_CHARS     = 40
+
 class I2cLcd(LcdApi):
     
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
@@ -18,6 +21,10 @@ class I2cLcd(LcdApi):
     def __init__(self, i2c, i2c_addr, num_lines, num_columns):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
+        # Preallocated transfer buffer: the whole nibble/strobe sequence of a
+        # command or a run of characters goes out in a single writeto
+        self._buf = bytearray(4 * BATCH_CHARS)
+        self._mv = memoryview(self._buf)
         self.i2c.writeto(self.i2c_addr, bytes([0]))
         utime.sleep_ms(20)   # Allow LCD time to powerup
         # Send reset 3 times
@@ -40,40 +47,59 @@ class I2cLcd(LcdApi):
         # Writes an initialization nibble to the LCD.
         # This particular function is only used during initialization.
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._buf[0] = byte | MASK_E
+        self._buf[1] = byte
+        self.i2c.writeto(self.i2c_addr, self._mv[:2])
         
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
+        self._buf[0] = 1 << SHIFT_BACKLIGHT
+        self.i2c.writeto(self.i2c_addr, self._mv[:1])
         
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
+        self._buf[0] = 0
+        self.i2c.writeto(self.i2c_addr, self._mv[:1])
+
+    def hal_sleep_us(self, usecs):
+        # Sleep for some time (given in microseconds)
+        utime.sleep_us(usecs)
+
+    def _pack(self, pos, value, rs):
+        # Store the 4 bus states for one LCD byte at pos: high nibble with E
+        # set then cleared, and the same for the low nibble.
+        # Data is latched on the falling edge of E.
+        byte = rs | (self.backlight << SHIFT_BACKLIGHT)
+        hi = byte | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        lo = byte | ((value & 0x0f) << SHIFT_DATA)
+        buf = self._buf
+        buf[pos] = hi | MASK_E
+        buf[pos + 1] = hi
+        buf[pos + 2] = lo | MASK_E
+        buf[pos + 3] = lo
         
     def hal_write_command(self, cmd):
-        # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        # Write a command to the LCD in one transfer.
+        self._pack(0, cmd, 0)
+        self.i2c.writeto(self.i2c_addr, self._mv[:4])
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
             utime.sleep_ms(5)
 
     def hal_write_data(self, data):
-        # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))      
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        # Write data to the LCD in one transfer.
+        self._pack(0, data, MASK_RS)
+        self.i2c.writeto(self.i2c_addr, self._mv[:4])
+
+    def hal_write_data_bytes(self, data):
+        # Write a run of data bytes, up to BATCH_CHARS per transfer.
+        # Each byte takes longer on the bus than the controller needs to
+        # execute it, so no extra delay is required between them.
+        n = len(data)
+        i = 0
+        while i < n:
+            k = min(n - i, BATCH_CHARS)
+            for j in range(k):
+                self._pack(4 * j, data[i + j], MASK_RS)
+            self.i2c.writeto(self.i2c_addr, self._mv[:4 * k])
+            i += k
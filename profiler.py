@@ -0,0 +1,177 @@
+# 実行状況の計測
+# タスクごとの起床遅れ (要求した時間に対する遅れ ms)・処理時間 (us)・確保量 (バイト)・回数を
+# 固定区間のヒストグラムに集計し、gc.mem_free()・ヒープ使用量の最大・稼働時間と合わせて
+# BLE の stats コマンドで出力する
+# 確保量は 1 周期の前後の gc.mem_alloc() の差 (途中で GC が走った周期は数えない)
+#
+#   P = PROF.probe('ultra')
+#   await P.sleep(sec)                 # asyncio.sleep の代わり (前回の起床からここまでを処理時間とする)
+#   await P.sleep_ms(ms)               # asyncio.sleep_ms の代わり
+#   woke = await P.wait(sub, timeout)  # Subscriber.wait の代わり (タイムアウトで起きた時だけ遅れを記録)
+#   @PROF.timed('logger')              # 引数 1 つの同期関数の処理時間と回数
+#   PROF.idle_collect(min_free)        # 空き時間の GC (空きが少ない時だけ)
+#
+# enabled=False の場合はヒストグラムを持たず、timed() は関数をそのまま返す
+
+import array
+import gc
+import uasyncio as asyncio
+import utime
+
+LAG_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+RUN_EDGES_US = (100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+ALLOC_EDGES = (1, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+class Histogram:
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = array.array('I', [0] * (len(edges) + 1))  # 最後は最大の区切りを超えた分
+        self.total = 0
+        self.max = 0
+        self.n = 0
+
+    def add(self, v):
+        i = 0
+        for edge in self.edges:
+            if v < edge:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += v
+        self.n += 1
+        if v > self.max:
+            self.max = v
+
+    def avg(self):
+        return self.total // self.n if self.n else 0
+
+    def format(self):
+        return f"{self.avg()}/{self.max} [{','.join(str(c) for c in self.counts)}]"
+
+
+class Probe:
+    def __init__(self, name, profiler, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.calls = 0
+        self._prof = profiler
+        if enabled:
+            self.lag = Histogram(LAG_EDGES_MS)
+            self.run = Histogram(RUN_EDGES_US)
+            self.alloc = Histogram(ALLOC_EDGES)
+        self._woke = None  # 最後に起床した ticks_us (最初の待ちまでは None)
+        self._alloc0 = 0
+
+    # 起床してから待ちに入るまでの処理時間と確保量
+    def _end_run(self):
+        if self._woke is not None:
+            self.run.add(utime.ticks_diff(utime.ticks_us(), self._woke))
+            self._add_alloc(self._alloc0)
+
+    def _begin_run(self):
+        self.calls += 1
+        self._woke = utime.ticks_us()
+        self._alloc0 = gc.mem_alloc()
+
+    def _add_alloc(self, a0):
+        a = gc.mem_alloc()
+        if a >= a0:
+            self.alloc.add(a - a0)
+        if a > self._prof.peak_alloc:
+            self._prof.peak_alloc = a
+
+    async def sleep(self, sec):
+        if not self.enabled:
+            await asyncio.sleep(sec)
+            return
+        self._end_run()
+        t0 = utime.ticks_ms()
+        await asyncio.sleep(sec)
+        self.lag.add(max(0, utime.ticks_diff(utime.ticks_ms(), t0) - int(sec * 1000)))
+        self._begin_run()
+
+    async def sleep_ms(self, ms):
+        if not self.enabled:
+            await asyncio.sleep_ms(ms)
+            return
+        self._end_run()
+        t0 = utime.ticks_ms()
+        await asyncio.sleep_ms(ms)
+        self.lag.add(max(0, utime.ticks_diff(utime.ticks_ms(), t0) - ms))
+        self._begin_run()
+
+    async def wait(self, sub, timeout=None):
+        if not self.enabled:
+            return await sub.wait(timeout)
+        self._end_run()
+        t0 = utime.ticks_ms()
+        woke = await sub.wait(timeout)
+        if not woke:
+            self.lag.add(max(0, utime.ticks_diff(utime.ticks_ms(), t0) - int(timeout * 1000)))
+        self._begin_run()
+        return woke
+
+    # 同期関数 1 回分
+    def record(self, t0_us, alloc0):
+        self.calls += 1
+        self.run.add(utime.ticks_diff(utime.ticks_us(), t0_us))
+        self._add_alloc(alloc0)
+
+    def format(self):
+        if not self.enabled:
+            return f"{self.name} n={self.calls}"
+        lag = f" lag_ms={self.lag.format()}" if self.lag.n else ''
+        return f"{self.name} n={self.calls}{lag} run_us={self.run.format()} alloc_b={self.alloc.format()}"
+
+
+class Profiler:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.probes = []
+        self.peak_alloc = 0  # 計測点で見たヒープ使用量の最大
+        self.collects = 0  # idle_collect() で GC した回数
+        self.gc_run = Histogram(RUN_EDGES_US)
+
+    def probe(self, name):
+        p = Probe(name, self, self.enabled)
+        self.probes.append(p)
+        return p
+
+    # 引数 1 つの同期関数の処理時間を計る。無効時は関数をそのまま返す
+    # *args / **kwargs で受けると呼ぶたびにタプルと辞書を確保するので、引数の数は固定にしている
+    def timed(self, name):
+        def deco(fn):
+            if not self.enabled:
+                return fn
+            p = self.probe(name)
+
+            def wrapper(arg):
+                a0 = gc.mem_alloc()
+                t0 = utime.ticks_us()
+                r = fn(arg)
+                p.record(t0, a0)
+                return r
+            return wrapper
+        return deco
+
+    # 空き時間 (次の処理まで余裕がある所) で呼ぶ。空きが min_free を下回っていれば GC する
+    # 処理の途中で自動の GC が走るのを減らす。GC したら True
+    def idle_collect(self, min_free):
+        if gc.mem_free() >= min_free:
+            return False
+        a = gc.mem_alloc()
+        if a > self.peak_alloc:
+            self.peak_alloc = a
+        t0 = utime.ticks_us()
+        gc.collect()
+        self.gc_run.add(utime.ticks_diff(utime.ticks_us(), t0))
+        self.collects += 1
+        return True
+
+    # stats コマンドの出力 (1 行ずつ)
+    def report(self, uptime_sec):
+        yield f"stats up={uptime_sec}s mem_free={gc.mem_free()} mem_alloc={gc.mem_alloc()} peak={self.peak_alloc} profile={'on' if self.enabled else 'off'}"
+        yield f"gc idle={self.collects} run_us={self.gc_run.format()}"
+        for p in self.probes:
+            yield p.format()
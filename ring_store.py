@@ -0,0 +1,161 @@
+# 事前確保したセグメントファイルを循環させるログ保存
+# 日ごとのファイルを追記・作成・削除すると LittleFS の書き込み時間が読めず消耗も偏るため、
+# 固定数・固定長のセグメントファイルを最初に作っておき、その中を先頭から上書きしていく
+# 一杯になったら次のセグメントへ進み、一周したら最古のセグメントを上書きする (保存期間の管理が不要)
+#
+# ヘッダファイル (ring.hdr)
+#   b'WGRH', 版, セグメント数, 先頭 (書き込み中), 末尾 (最古), セグメント長 (I)
+#   セグメントごとに 通し番号 (I), 使用バイト数 (I)
+# 書き込みはセグメントの使用位置への上書きと、ヘッダの使用バイト数 4 バイトの上書きだけ
+
+import struct
+import uos
+
+MAGIC = b'WGRH'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBBI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ENTRY_FORMAT = '<II'
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+_FILL = 256  # 事前確保で 1 回に書くバイト数
+
+
+class RingStore:
+    def __init__(self, root='/log', segments=8, segment_size=32768, prefix='ring'):
+        self.root = root
+        self.prefix = prefix
+        self.count = segments
+        self.segment_size = segment_size
+        self.head = 0
+        self.tail = 0
+        self._seq = [0] * segments
+        self._used = [0] * segments
+        self._ready = False
+        self.formats = 0  # セグメントを作り直した回数
+        self.overwrites = 0  # 最古のセグメントを上書きした回数
+
+    def name(self, i):
+        return f"{self.prefix}_{i:02d}.txt"
+
+    def path(self, i):
+        return f"{self.root}/{self.name(i)}"
+
+    def _header_path(self):
+        return f"{self.root}/{self.prefix}.hdr"
+
+    # ヘッダを読み、セグメントが揃っていなければ作り直す
+    def open(self):
+        if not self._load():
+            self.format()
+        self._ready = True
+
+    def _load(self):
+        try:
+            with open(self._header_path(), 'rb') as f:
+                data = f.read()
+            magic, version, count, head, tail, size = struct.unpack_from(HEADER_FORMAT, data)
+            if magic != MAGIC or version != VERSION or count != self.count or size != self.segment_size:
+                return False
+            # 壊れたヘッダの位置をそのまま使うと範囲外を読み書きするので作り直す
+            if head >= count or tail >= count or len(data) < HEADER_SIZE + count * ENTRY_SIZE:
+                return False
+            for i in range(count):
+                self._seq[i], self._used[i] = struct.unpack_from(ENTRY_FORMAT, data, HEADER_SIZE + i * ENTRY_SIZE)
+                if self._used[i] > size or uos.stat(self.path(i))[6] != size:
+                    return False
+        except (OSError, ValueError):
+            return False
+        self.head = head
+        self.tail = tail
+        return True
+
+    # すべてのセグメントを確保し直して空にする
+    def format(self):
+        try:
+            uos.mkdir(self.root)
+        except OSError:
+            pass
+        fill = b'\xff' * _FILL
+        for i in range(self.count):
+            with open(self.path(i), 'wb') as f:
+                left = self.segment_size
+                while left > 0:
+                    f.write(fill if left >= _FILL else fill[:left])
+                    left -= _FILL
+            self._seq[i] = 0
+            self._used[i] = 0
+        self.head = 0
+        self.tail = 0
+        self._seq[0] = 1
+        self._write_header()
+        self.formats += 1
+
+    def _write_header(self):
+        buf = bytearray(HEADER_SIZE + self.count * ENTRY_SIZE)
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, VERSION, self.count, self.head, self.tail, self.segment_size)
+        for i in range(self.count):
+            struct.pack_into(ENTRY_FORMAT, buf, HEADER_SIZE + i * ENTRY_SIZE, self._seq[i], self._used[i])
+        with open(self._header_path(), 'wb') as f:
+            f.write(buf)
+
+    # 書き込み中のセグメントの使用バイト数だけを上書きする
+    def _write_used(self):
+        with open(self._header_path(), 'r+b') as f:
+            f.seek(HEADER_SIZE + self.head * ENTRY_SIZE + 4)
+            f.write(struct.pack('<I', self._used[self.head]))
+
+    # 次のセグメントへ進む。一周していれば最古のセグメントを捨てる
+    def _advance(self):
+        nxt = (self.head + 1) % self.count
+        if self._seq[nxt]:
+            self.tail = (nxt + 1) % self.count
+            self.overwrites += 1
+        self._seq[nxt] = self._seq[self.head] + 1
+        self._used[nxt] = 0
+        self.head = nxt
+        self._write_header()
+
+    # data (bytes) を追記する。セグメントに収まらなければ次のセグメントから書く
+    # (行の途中でセグメントを跨がないよう、まとめて渡された分は 1 つのセグメントに入れる)
+    def append(self, data):
+        if not self._ready:
+            self.open()
+        mv = memoryview(data)
+        while len(mv):
+            space = self.segment_size - self._used[self.head]
+            if len(mv) > space and self._used[self.head]:
+                self._advance()
+                space = self.segment_size
+            n = min(space, len(mv))
+            with open(self.path(self.head), 'r+b') as f:
+                f.seek(self._used[self.head])
+                f.write(mv[:n])
+            self._used[self.head] += n
+            self._write_used()
+            mv = mv[n:]
+
+    # 古い順の (名前, 使用バイト数)
+    def segments(self):
+        if not self._ready:
+            self.open()
+        out = []
+        i = self.tail
+        while True:
+            if self._seq[i]:
+                out.append((self.name(i), self._used[i]))
+            if i == self.head:
+                break
+            i = (i + 1) % self.count
+        return out
+
+    # ring のセグメント名なら使用バイト数、それ以外は None
+    def size_of(self, name):
+        for i in range(self.count):
+            if name == self.name(i):
+                if not self._ready:
+                    self.open()
+                return self._used[i]
+        return None
+
+    def owns(self, name):
+        return name == f"{self.prefix}.hdr" or self.size_of(name) is not None
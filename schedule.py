@@ -0,0 +1,75 @@
+# 運用時間帯の判定
+# operation_time.json の時間帯を読み込み時に 1 週間分の分単位ビットマップと
+# 切替時刻の昇順テーブルにコンパイルし、判定と次の切替時刻の計算を定数時間で行う
+#
+# 時間帯の形式: {"id": 1, "start_time": "HH:MM", "end_time": "HH:MM", "days": [0, ...]}
+#   end_time が start_time 以前なら翌日にまたがる ("24:00" も可)
+#   days は省略可 (毎日)。0=月曜 … 6=日曜 (utime.localtime() の曜日と同じ)
+#   有効/無効は設定の ope_time_<id> (無ければ項目の "enabled")
+
+from array import array
+
+DAY_MIN = 1440
+WEEK_MIN = 7 * DAY_MIN
+
+
+def parse_hhmm(s):
+    hh, mm = s.split(':')
+    return int(hh) * 60 + int(mm)
+
+
+class Schedule:
+    def __init__(self):
+        self._bits = bytearray(WEEK_MIN // 8)
+        self._bounds = array('H')  # 状態が切り替わる週内の分
+
+    def compile(self, windows, config):
+        bits = self._bits
+        for i in range(len(bits)):
+            bits[i] = 0
+        for item in windows:
+            if not config.get('ope_time_' + str(item['id']), item.get('enabled', False)):
+                continue
+            start = parse_hhmm(item['start_time'])
+            end = parse_hhmm(item['end_time'])
+            if end <= start:
+                end += DAY_MIN
+            for day in item.get('days', range(7)):
+                base = day * DAY_MIN
+                for m in range(base + start, base + end):
+                    m %= WEEK_MIN
+                    bits[m >> 3] |= 1 << (m & 7)
+        bounds = array('H')
+        prev = self._bit(WEEK_MIN - 1)
+        for m in range(WEEK_MIN):
+            cur = self._bit(m)
+            if cur != prev:
+                bounds.append(m)
+                prev = cur
+        self._bounds = bounds
+
+    def _bit(self, m):
+        return (self._bits[m >> 3] >> (m & 7)) & 1
+
+    @staticmethod
+    def minute_of_week(t):
+        return t[6] * DAY_MIN + t[3] * 60 + t[4]
+
+    def is_active(self, t):
+        return self._bit(self.minute_of_week(t)) == 1
+
+    # 次の切替までの秒数。切替が無ければ None
+    def seconds_until_next(self, t):
+        bounds = self._bounds
+        if not bounds:
+            return None
+        now = self.minute_of_week(t)
+        lo, hi = 0, len(bounds)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bounds[mid] <= now:
+                lo = mid + 1
+            else:
+                hi = mid
+        nxt = bounds[lo] if lo < len(bounds) else bounds[0] + WEEK_MIN
+        return (nxt - now) * 60 - t[5]
@@ -0,0 +1,16 @@
+# ホスト (CPython) 上で main.py を仮想時間で動かすシミュレータ
+#
+#   from sim import Simulation, ScriptedLevel
+#   with Simulation(days=2, level=ScriptedLevel([(0, 8), (86400, 2)])) as s:
+#       s.central.schedule(3600, 'connect')
+#       s.central.schedule(3601, 'write', b'self')
+#       s.central.schedule(3602, 'write', b'open')
+#       s.run_main()
+#       print(s.summary())
+#
+# 関数単体を動かす場合は s.run_main(run=False) で読み込み、s.run(s.main.wopen(10)) のように実行する
+
+from .ble import FakeCentral, UUID
+from .clock import StopSimulation, VirtualClock
+from .runner import Reset, Simulation
+from .world import GateModel, ScriptedLevel, World
@@ -0,0 +1,42 @@
+# python -m sim --days 3 --level 0:8,43200:3,86400:8 --echo
+
+import argparse
+import json
+
+from . import ScriptedLevel, Simulation
+
+
+FORCE_PINS = {'open': 2, 'close': 3}  # main.py の FORCE_OPEN / FORCE_CLOSE (押すと 0)
+
+
+def _points(text):
+    pts = []
+    for item in text.split(','):
+        t, v = item.split(':')
+        pts.append((float(t), float(v)))
+    return pts
+
+
+def main():
+    ap = argparse.ArgumentParser(description='watergate main.py simulator')
+    ap.add_argument('--days', type=float, default=1.0)
+    ap.add_argument('--level', type=_points, default=[(0, 8.0), (43200, 2.0), (86400, 8.0)],
+                    help='水位の台本 秒:cm,秒:cm,...')
+    ap.add_argument('--noise', type=float, default=0.3)
+    ap.add_argument('--dropout', type=float, default=0.0)
+    ap.add_argument('--drain', type=float, default=0.0, help='開門中の水位低下 cm/時')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--echo', action='store_true', help='ファームウェアの print を表示する')
+    ap.add_argument('--hold', choices=('open', 'close'), help='強制スイッチを押したまま起動する')
+    args = ap.parse_args()
+    level = ScriptedLevel(args.level, noise_cm=args.noise, dropout=args.dropout,
+                          drain_cm_per_hour=args.drain, seed=args.seed)
+    with Simulation(days=args.days, level=level, echo=args.echo) as s:
+        if args.hold:
+            s.world.drive(FORCE_PINS[args.hold], 0)
+        s.run_main()
+        print(json.dumps(s.summary(), ensure_ascii=False, indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# bluetooth.BLE の代替と、それに接続する仮想セントラル (スマホ役)
+
+import random
+import uuid as _uuid
+
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_MTU_EXCHANGED = 21
+
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, UUID):
+            value = value.value
+        if isinstance(value, (bytes, bytearray)):
+            value = bytes(value)
+            value = int.from_bytes(value, 'little') if len(value) <= 4 else str(_uuid.UUID(bytes=value[::-1])).upper()
+        elif isinstance(value, str):
+            value = value.upper()
+        self.value = value
+
+    def __bytes__(self):
+        if isinstance(self.value, int):
+            return self.value.to_bytes(2 if self.value < 0x10000 else 4, 'little')
+        return _uuid.UUID(self.value).bytes[::-1]
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f"UUID({self.value!r})"
+
+
+class FakeBLE:
+    def __init__(self, world):
+        self.world = world
+        self._active = False
+        self._irq = None
+        self.config_values = {'mtu': 23}
+        self.values = {}  # handle -> bytes
+        self.uuids = {}  # UUID 文字列 -> handle
+        self._next_handle = 1
+        self.advertising = []  # (t, interval_us, adv_data, resp_data)
+
+    def active(self, value=None):
+        if value is not None:
+            self._active = bool(value)
+        return self._active
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self.config_values.get(args[0])
+        self.config_values.update(kwargs)
+
+    def irq(self, handler):
+        self._irq = handler
+
+    def _event(self, event, data):
+        if self._irq:
+            self._irq(event, data)
+
+    def gatts_register_services(self, services):
+        result = []
+        for _, chars in services:
+            handles = []
+            for ch in chars:
+                h = self._alloc(ch[0])
+                handles.append(h)
+                for desc in (ch[2] if len(ch) > 2 else ()):
+                    handles.append(self._alloc(desc[0]))
+            result.append(tuple(handles))
+        return tuple(result)
+
+    def _alloc(self, uuid):
+        h = self._next_handle
+        self._next_handle += 1
+        self.values[h] = b''
+        self.uuids[UUID(uuid).value] = h
+        return h
+
+    def gatts_read(self, handle):
+        return self.values[handle]
+
+    def gatts_write(self, handle, data, send_update=False):
+        self.values[handle] = bytes(data)
+        central = self.world.central
+        if send_update and central and central.connected and handle in central.subscribed:
+            central._notify(handle, self.values[handle])
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        central = self.world.central
+        if not central or not central.connected or central.conn_handle != conn_handle:
+            raise OSError(128)
+        if central.busy():
+            raise OSError(12)
+        if data is None:
+            data = self.values[value_handle]
+        central._notify(value_handle, bytes(data))
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        self.advertising.append((self.world.clock.seconds(), interval_us,
+                                 bytes(adv_data) if adv_data is not None else None,
+                                 bytes(resp_data) if resp_data is not None else None))
+
+
+class FakeCentral:
+    # fail_rate: gatts_notify が ENOMEM になる確率 (コントローラのバッファ溢れの模擬)
+    def __init__(self, world, conn_handle=64, fail_rate=0.0, seed=0):
+        self.world = world
+        self.conn_handle = conn_handle
+        self.fail_rate = fail_rate
+        self.connected = False
+        self.mtu = 23
+        self.subscribed = set()
+        self.received = []  # (t, handle, bytes)
+        self._rand = random.Random(seed)
+
+    @property
+    def ble(self):
+        return self.world.ble
+
+    def busy(self):
+        return self.fail_rate and self._rand.random() < self.fail_rate
+
+    def _notify(self, handle, data):
+        # 実機同様に MTU を超えた分は切り捨てる
+        self.received.append((self.world.clock.seconds(), handle, data[:self.mtu - 3]))
+
+    def handle(self, uuid):
+        return self.ble.uuids[UUID(uuid).value]
+
+    def connect(self, subscribe=True):
+        self.connected = True
+        self.mtu = 23
+        if subscribe:
+            self.subscribed = set(self.ble.values)
+        self.ble._event(_IRQ_CENTRAL_CONNECT, (self.conn_handle, 0, b'\x00' * 6))
+
+    def disconnect(self):
+        self.connected = False
+        self.ble._event(_IRQ_CENTRAL_DISCONNECT, (self.conn_handle, 0, b'\x00' * 6))
+
+    def exchange_mtu(self, mtu):
+        self.mtu = mtu
+        self.ble._event(_IRQ_MTU_EXCHANGED, (self.conn_handle, mtu))
+
+    def write(self, data, uuid='6E400002-B5A3-F393-E0A9-E50E24DCCA9E'):
+        if isinstance(data, str):
+            data = data.encode()
+        h = self.handle(uuid)
+        self.ble.values[h] = bytes(data)
+        self.ble._event(_IRQ_GATTS_WRITE, (self.conn_handle, h))
+
+    def read(self, uuid):
+        return self.ble.values[self.handle(uuid)]
+
+    # 仮想時刻 t 秒に操作を予約する  例: central.schedule(60, 'write', b'self')
+    def schedule(self, t, action, *args):
+        self.world.at(t, getattr(self, action), *args)
+
+    def notifications(self, uuid='6E400003-B5A3-F393-E0A9-E50E24DCCA9E'):
+        h = self.handle(uuid)
+        return [(t, d) for t, hh, d in self.received if hh == h]
+
+    # UART (TX) の通知を連結した文字列
+    def text(self):
+        data = b''.join(d for _, d in self.notifications())
+        return data.decode('utf-8', 'replace')
+
+    # UART の通知をメッセージ (改行で終わる) ごとに分けたもの。最後の未完のメッセージは含めない
+    def messages(self):
+        return self.text().split('\n')[:-1]
@@ -0,0 +1,62 @@
+# 仮想時計と仮想時間で動くイベントループ
+# セレクタが待つ代わりに時計を進めるので、眠っているだけの時間は実時間を消費しない
+
+import asyncio
+import math
+import selectors
+
+
+class StopSimulation(BaseException):
+    # 指定したシミュレーション時間に達した (main.py の except Exception では捕まらない)
+    pass
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now_us = 0
+        self.stop_us = None
+        self.stopped = False
+
+    def advance_us(self, us):
+        self.now_us += max(0, int(us))
+
+    def advance(self, sec):
+        self.advance_us(math.ceil(sec * 1_000_000))
+
+    def seconds(self):
+        return self.now_us / 1_000_000
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    # シミュレーションでは実 I/O が無いので OS の select は呼ばない
+    def select(self, timeout=None):
+        ready = []
+        if self._clock.stopped:
+            # 停止後の後始末 (タスクのキャンセル) は時間だけ進めて続ける
+            if timeout:
+                self._clock.advance(timeout)
+            return ready
+        if timeout is None:
+            # 待つものが何もない (全タスクが外部入力待ち)
+            self._clock.stopped = True
+            raise StopSimulation('idle')
+        clock = self._clock
+        if clock.stop_us is not None and clock.now_us + timeout * 1_000_000 >= clock.stop_us:
+            clock.now_us = max(clock.now_us, clock.stop_us)
+            clock.stopped = True
+            raise StopSimulation('time')
+        clock.advance(timeout)
+        return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self._virtual_clock = clock
+
+    def time(self):
+        return self._virtual_clock.seconds()
@@ -0,0 +1,2 @@
+# MicroPython のモジュール (machine, utime, uos, uasyncio, bluetooth, micropython, gc) の CPython 向け代替
+# sim.runner.install() が sys.modules に登録する
@@ -0,0 +1,15 @@
+from sim.ble import UUID, FakeBLE
+from sim.world import current
+
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+FLAG_INDICATE = 0x0020
+
+
+def BLE():
+    w = current()
+    if w.ble is None:
+        w.ble = FakeBLE(w)
+    return w.ble
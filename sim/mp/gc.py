@@ -0,0 +1,32 @@
+# gc の代替: CPython の gc に MicroPython の mem_free / mem_alloc を足す
+# ヒープは HEAP_SIZE 固定とし、確保量は tracemalloc で追跡中ならその値、そうでなければ 0 とする
+# (CPython は参照が切れた時点で解放するので、周期ごとの差は残った分だけになる)
+
+import gc as _gc
+import tracemalloc
+
+HEAP_SIZE = 192 * 1024
+
+collect = _gc.collect
+enable = _gc.enable
+disable = _gc.disable
+isenabled = _gc.isenabled
+
+_threshold = -1
+
+
+def mem_alloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def mem_free():
+    return max(0, HEAP_SIZE - mem_alloc())
+
+
+def threshold(amount=None):
+    global _threshold
+    if amount is None:
+        return _threshold
+    _threshold = amount
@@ -0,0 +1,120 @@
+import calendar
+
+from sim.mp.utime import localtime as _localtime
+from sim.world import current, IRQ_FALLING, IRQ_RISING
+
+
+class Reset(BaseException):
+    # machine.reset() が呼ばれた (シミュレーションはここで終わる)
+    pass
+
+
+def reset():
+    current().resets += 1
+    raise Reset()
+
+
+soft_reset = reset
+
+
+def freq(hz=None):
+    return 125_000_000
+
+
+def unique_id():
+    return b'\xe6\x61\x38\x00\x00\x00\x00\x01'
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = IRQ_FALLING
+    IRQ_RISING = IRQ_RISING
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.id = pin_id
+        self._s = current().pin_state(pin_id)
+        if pull == Pin.PULL_UP and mode == Pin.IN and not self._s.driven:
+            self._s.set(1)
+        if value is not None:
+            self._s.set(value)
+
+    def value(self, v=None):
+        if v is None:
+            return self._s.value
+        self._s.set(v)
+
+    __call__ = value
+
+    def on(self):
+        self._s.set(1)
+
+    def off(self):
+        self._s.set(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self._s.set(not self._s.value)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._s.handler = handler
+        self._s.trigger = trigger
+        self._s.pin = self
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+
+class RTC:
+    # datetime: (year, month, day, weekday, hours, minutes, seconds, subseconds)
+    def datetime(self, dt=None):
+        w = current()
+        if dt is None:
+            t = w.wall_time()
+            y, mo, d, h, mi, s, wd, _ = _localtime(int(t))
+            return (y, mo, d, wd, h, mi, s, 0)
+        w.set_wall_time(calendar.timegm((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6])))
+
+
+class _I2C:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _dev(self, addr):
+        dev = current().i2c_devices.get(addr)
+        if dev is None:
+            raise OSError(5)
+        return dev
+
+    def scan(self):
+        return sorted(current().i2c_devices)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._dev(addr).read(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        buf[:] = self._dev(addr).read(memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._dev(addr).write(memaddr, bytes(buf))
+
+    def writeto(self, addr, buf, stop=True):
+        dev = self._dev(addr)
+        dev.write_raw(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._dev(addr).read_raw(nbytes)
+
+
+class I2C(_I2C):
+    pass
+
+
+class SoftI2C(_I2C):
+    pass
@@ -0,0 +1,56 @@
+# uasyncio の代替: CPython の asyncio を仮想時間のイベントループで動かす
+
+import asyncio as _asyncio
+from asyncio import (CancelledError, Event, Lock, TimeoutError, create_task, current_task,
+                     gather, get_event_loop, sleep, wait_for)
+
+from sim.clock import VirtualEventLoop
+from sim.world import current
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout_ms):
+    return await _asyncio.wait_for(aw, timeout_ms / 1000)
+
+
+class ThreadSafeFlag:
+    # IRQ から set() できるフラグ。wait() は 1 つのタスクだけが待つ
+    def __init__(self):
+        self._set = False
+        self._waiter = None
+
+    def set(self):
+        self._set = True
+        w = self._waiter
+        if w is not None and not w.done():
+            w.set_result(None)
+
+    def clear(self):
+        self._set = False
+
+    async def wait(self):
+        while not self._set:
+            self._waiter = _asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        self._set = False
+
+
+def new_event_loop():
+    return VirtualEventLoop(current().clock)
+
+
+def run(coro):
+    w = current()
+    loop = new_event_loop()
+    w.attach_loop(loop)
+    try:
+        with _asyncio.Runner(loop_factory=lambda: loop) as runner:
+            return runner.run(coro)
+    finally:
+        w.loop = None
@@ -0,0 +1,46 @@
+import os as _os
+
+from sim.world import current
+
+
+def _p(path):
+    return current().fs.path(path)
+
+
+def listdir(path='/'):
+    return sorted(_os.listdir(_p(path)))
+
+
+def ilistdir(path='/'):
+    for name in listdir(path):
+        full = _os.path.join(_p(path), name)
+        yield (name, 0x4000 if _os.path.isdir(full) else 0x8000, 0, _os.path.getsize(full))
+
+
+def mkdir(path):
+    _os.mkdir(_p(path))
+
+
+def rmdir(path):
+    _os.rmdir(_p(path))
+
+
+def remove(path):
+    _os.remove(_p(path))
+
+
+def rename(old, new):
+    _os.replace(_p(old), _p(new))
+
+
+def stat(path):
+    st = _os.stat(_p(path))
+    return (0x4000 if _os.path.isdir(_p(path)) else 0x8000, 0, 0, 0, 0, 0, st.st_size, 0, 0, 0)
+
+
+def statvfs(path='/'):
+    return (4096, 4096, 212, 200, 200, 0, 0, 0, 0, 255)
+
+
+def uname():
+    return ('rp2', 'sim', '1.23.0', 'sim', 'Raspberry Pi Pico W (simulated)')
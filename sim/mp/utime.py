@@ -0,0 +1,63 @@
+import calendar
+import time as _time
+
+from sim.world import current
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def ticks_us():
+    return current().clock.now_us & _TICKS_MAX
+
+
+def ticks_ms():
+    return (current().clock.now_us // 1000) & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(a, b):
+    return ((a - b + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def ticks_add(t, delta):
+    return (t + delta) & _TICKS_MAX
+
+
+# ブロッキングの sleep は仮想時計を進めるだけ (実機でもループ全体が止まる)
+def sleep(sec):
+    current().clock.advance(sec)
+
+
+def sleep_ms(ms):
+    current().clock.advance_us(ms * 1000)
+
+
+def sleep_us(us):
+    current().clock.advance_us(us)
+
+
+def time():
+    return int(current().wall_time())
+
+
+def time_ns():
+    return int(current().wall_time() * 1_000_000_000)
+
+
+def localtime(secs=None):
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+gmtime = localtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]))
@@ -0,0 +1,185 @@
+# main.py を変更せずに CPython 上で動かす
+# MicroPython モジュールの代替を sys.modules に登録し、ファームウェアのモジュールは
+# open / print をシミュレーションのフラッシュ・コンソールに向けて読み込む
+
+import importlib.abc
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+
+from . import world as _world
+from .ble import FakeCentral
+from .clock import StopSimulation
+from .mp import bluetooth, gc, machine, micropython, uasyncio, uos, utime
+from .world import World, ScriptedLevel
+
+FIRMWARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAND_INS = {
+    'machine': machine,
+    'utime': utime,
+    'uos': uos,
+    'uasyncio': uasyncio,
+    'bluetooth': bluetooth,
+    'micropython': micropython,
+    'gc': gc,
+}
+
+Reset = machine.Reset
+
+
+def firmware_modules(firmware_dir=FIRMWARE_DIR):
+    return {name[:-3] for name in os.listdir(firmware_dir)
+            if name.endswith('.py') and not name.startswith('.')}
+
+
+class _FirmwareLoader(importlib.abc.Loader):
+    def __init__(self, path, world):
+        self.path = path
+        self.world = world
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        module.__dict__['open'] = self.world.fs.open
+        module.__dict__['print'] = self.world.print
+        with open(self.path, encoding='utf-8') as f:
+            code = compile(f.read(), self.path, 'exec')
+        exec(code, module.__dict__)
+
+
+class _FirmwareFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, firmware_dir, world):
+        self.dir = firmware_dir
+        self.world = world
+        self.names = firmware_modules(firmware_dir)
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in self.names:
+            return None
+        file = os.path.join(self.dir, name + '.py')
+        return importlib.util.spec_from_file_location(name, file, loader=_FirmwareLoader(file, self.world))
+
+
+class Simulation:
+    # start: 内蔵 RTC の初期時刻 (JST)。DS1307 はその 9 時間前 (UTC) から動く
+    # days: この仮想日数が経過したら停止する
+    def __init__(self, days=1.0, start=(2024, 6, 1, 0, 0, 0), level=None, root=None,
+                 firmware_dir=FIRMWARE_DIR, files=None, echo=False, **world_kwargs):
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix='watergate-sim-')
+            root = self._tmp.name
+        self.world = World(root, start=start, level=level, echo=echo, **world_kwargs)
+        self.world.clock.stop_us = int(days * 86400 * 1_000_000)
+        self.world.central = FakeCentral(self.world)
+        self.firmware_dir = firmware_dir
+        self.main = None
+        self.stop_reason = None
+        # 初期ファイル (例: {'/config.json': '{...}'})。既定はリポジトリの設定ファイル
+        if files is None:
+            files = {}
+            for name in ('config.json', 'operation_time.json'):
+                src = os.path.join(firmware_dir, name)
+                if os.path.exists(src):
+                    with open(src, encoding='utf-8') as f:
+                        files['/' + name] = f.read()
+        for path, text in files.items():
+            with self.world.fs.open(path, 'w') as f:
+                f.write(text)
+
+    @property
+    def central(self):
+        return self.world.central
+
+    @property
+    def gate(self):
+        return self.world.gate
+
+    def _install(self):
+        self._saved = {name: sys.modules.get(name) for name in STAND_INS}
+        sys.modules.update(STAND_INS)
+        self._finder = _FirmwareFinder(self.firmware_dir, self.world)
+        for name in self._finder.names:
+            sys.modules.pop(name, None)
+        sys.meta_path.insert(0, self._finder)
+        _world._set_current(self.world)
+
+    def _uninstall(self):
+        sys.meta_path.remove(self._finder)
+        for name in self._finder.names:
+            sys.modules.pop(name, None)
+        for name, mod in self._saved.items():
+            if mod is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = mod
+
+    # main.py を実行する。run=False なら import と同じく __name__ を 'main' にして
+    # asyncio.run(main()) を飛ばし、関数とグローバル変数だけを読み込む
+    # 戻り値は main モジュール (停止後もグローバル変数を参照できる)
+    def run_main(self, run=True):
+        self._install()
+        mod = types.ModuleType('__main__' if run else 'main')
+        mod.__file__ = os.path.join(self.firmware_dir, 'main.py')
+        sys.modules['main'] = mod
+        self.main = mod
+        try:
+            spec = self._finder.find_spec('main')
+            spec.loader.exec_module(mod)
+            self.stop_reason = 'returned' if run else 'loaded'
+        except StopSimulation as e:
+            self.stop_reason = str(e)
+        except Reset:
+            self.stop_reason = 'reset'
+        if self.world.clock.stopped and self.stop_reason == 'reset':
+            self.stop_reason = 'time'
+        return mod
+
+    # run_main(run=False) で読み込んだ後、main.py のコルーチンを仮想時間で動かす
+    def run(self, coro):
+        try:
+            return uasyncio.run(coro)
+        except StopSimulation as e:
+            self.stop_reason = str(e)
+            return None
+
+    def close(self):
+        if self.main is not None:
+            self._uninstall()
+            self.main = None
+        _world._set_current(None)
+        if self._tmp:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def files(self, path='/'):
+        return sorted(os.listdir(self.world.fs.path(path)))
+
+    def read(self, path):
+        with self.world.fs.open(path) as f:
+            return f.read()
+
+    def summary(self):
+        w = self.world
+        return {
+            'virtual_sec': round(w.clock.seconds(), 3),
+            'stop_reason': self.stop_reason,
+            'pings': w.sonar.pings,
+            'strokes': w.gate.strokes,
+            'gate_position': round(w.gate.current_position(), 3),
+            'motor_on_sec': round(w.gate.motor_on_sec, 1),
+            'notifications': len(w.central.received),
+            'console_lines': len(w.console),
+            'lcd': w.lcd.text() if w.lcd else None,
+            'files': self.files(),
+        }
@@ -0,0 +1,381 @@
+# シミュレーション対象の「世界」: 時計・ピン・I2C デバイス・フラッシュ・水位と水門のモデル
+# sim.mp 以下の代替モジュールは current() で現在の World を参照する
+
+import calendar
+import os
+import random
+import time
+
+from .clock import VirtualClock
+
+IRQ_FALLING = 4
+IRQ_RISING = 8
+
+_current = None
+
+
+def current():
+    if _current is None:
+        raise RuntimeError('simulation world is not installed')
+    return _current
+
+
+def _set_current(world):
+    global _current
+    _current = world
+
+
+def _bcd(v):
+    return (v // 10) << 4 | (v % 10)
+
+
+def _dec(v):
+    return ((v >> 4) * 10) + (v & 0x0F)
+
+
+class PinState:
+    def __init__(self, world, pin_id):
+        self.world = world
+        self.id = pin_id
+        self.value = 0
+        self.handler = None
+        self.trigger = 0
+        self.pin = None  # IRQ ハンドラに渡す Pin オブジェクト
+        self.driven = False  # 外から駆動されている (押したままのスイッチ等)。プルアップより優先
+        self.listeners = []  # fn(pin_id, value) 出力ピンを監視するモデル
+
+    def set(self, v):
+        v = 1 if v else 0
+        if v == self.value:
+            return
+        self.value = v
+        if self.handler and self.trigger & (IRQ_RISING if v else IRQ_FALLING):
+            self.handler(self.pin)
+        for fn in self.listeners:
+            fn(self.id, v)
+
+
+# 時間で区切った水位の台本 (points: [(経過秒, 水位cm), ...] を線形補間)
+# 水門が開いている間は drain_cm_per_hour で水位が下がる
+class ScriptedLevel:
+    def __init__(self, points, correction_cm=50, noise_cm=0.0, dropout=0.0,
+                 outlier_rate=0.0, drain_cm_per_hour=0.0, seed=0):
+        self.points = sorted(points)
+        self.correction_cm = correction_cm
+        self.noise_cm = noise_cm
+        self.dropout = dropout
+        self.outlier_rate = outlier_rate
+        self.drain_cm_per_hour = drain_cm_per_hour
+        self._rand = random.Random(seed)
+        self.world = None
+
+    def base_level(self, t):
+        pts = self.points
+        if t <= pts[0][0]:
+            return pts[0][1]
+        for (t0, v0), (t1, v1) in zip(pts, pts[1:]):
+            if t < t1:
+                return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+        return pts[-1][1]
+
+    def level_cm(self, t):
+        level = self.base_level(t)
+        if self.drain_cm_per_hour and self.world:
+            level -= self.drain_cm_per_hour * self.world.gate.open_seconds() / 3600
+        return level
+
+    # センサから水面までの距離 (cm)。エコーなしは None
+    def distance_cm(self, t):
+        r = self._rand
+        if self.dropout and r.random() < self.dropout:
+            return None
+        d = self.correction_cm - self.level_cm(t)
+        if self.noise_cm:
+            d += r.gauss(0, self.noise_cm)
+        if self.outlier_rate and r.random() < self.outlier_rate:
+            d += r.choice((-1, 1)) * r.uniform(10, 40)
+        return max(2.0, d)
+
+
+# HC-SR04: TRIG の立ち下がりで ECHO にパルスを返す
+class SonarModel:
+    ECHO_DELAY_US = 450
+
+    def __init__(self, world, trig, echo, level):
+        self.world = world
+        self.echo = echo
+        self.level = level
+        self.pings = 0
+        world.pin_state(trig).listeners.append(self._on_trig)
+
+    def _on_trig(self, pin_id, v):
+        if v:
+            return
+        self.pings += 1
+        d = self.level.distance_cm(self.world.clock.seconds())
+        if d is None:
+            return
+        width = int(d * 2 / 0.0343)
+        echo = self.world.pin_state(self.echo)
+        self.world.call_later_us(self.ECHO_DELAY_US, echo.set, 1)
+        self.world.call_later_us(self.ECHO_DELAY_US + width, echo.set, 0)
+
+
+# 水門モータ: M1=H で閉、M2=H で開。位置 0.0 (閉) 〜 1.0 (開) をストローク時間で積分する
+class GateModel:
+    def __init__(self, world, m1, m2, stroke_sec=60.0, position=1.0):
+        self.world = world
+        self.m1 = m1
+        self.m2 = m2
+        self.stroke_sec = stroke_sec
+        self.position = position
+        self.direction = 0  # 1: 開方向 -1: 閉方向
+        self.strokes = []  # {'start', 'end', 'direction', 'position'}
+        self.motor_on_sec = 0.0
+        self._open_sec = 0.0
+        self._last = 0.0
+        world.pin_state(m1).listeners.append(self._on_pin)
+        world.pin_state(m2).listeners.append(self._on_pin)
+
+    def _advance(self):
+        now = self.world.clock.seconds()
+        dt = now - self._last
+        self._last = now
+        if dt <= 0:
+            return
+        if self.position > 0.5:
+            self._open_sec += dt
+        if self.direction:
+            self.motor_on_sec += dt
+            self.position = min(1.0, max(0.0, self.position + self.direction * dt / self.stroke_sec))
+
+    def _on_pin(self, pin_id, v):
+        self._advance()
+        m1 = self.world.pin_state(self.m1).value
+        m2 = self.world.pin_state(self.m2).value
+        direction = 1 if (m2 and not m1) else -1 if (m1 and not m2) else 0
+        if direction == self.direction:
+            return
+        now = self.world.clock.seconds()
+        if self.direction and self.strokes:
+            self.strokes[-1]['end'] = now
+            self.strokes[-1]['position'] = self.position
+        self.direction = direction
+        if direction:
+            self.strokes.append({'start': now, 'end': None,
+                                 'direction': 'open' if direction > 0 else 'close',
+                                 'position': self.position})
+
+    def open_seconds(self):
+        self._advance()
+        return self._open_sec
+
+    def current_position(self):
+        self._advance()
+        return self.position
+
+
+# DS1307 (I2C 0x68): 時刻レジスタは仮想時計で進み、RAM (0x08-0x3F) は保持される
+class DS1307Model:
+    def __init__(self, world, epoch, drift_ppm=0.0):
+        self.world = world
+        self.drift_ppm = drift_ppm
+        self.regs = bytearray(64)
+        self._base = epoch
+        self._at = 0.0
+
+    def _now(self):
+        dt = self.world.clock.seconds() - self._at
+        return self._base + dt * (1 + self.drift_ppm / 1e6)
+
+    def _refresh(self):
+        t = time.gmtime(int(self._now()))
+        r = self.regs
+        r[0] = _bcd(t.tm_sec)
+        r[1] = _bcd(t.tm_min)
+        r[2] = _bcd(t.tm_hour)
+        r[3] = _bcd(t.tm_wday + 1)
+        r[4] = _bcd(t.tm_mday)
+        r[5] = _bcd(t.tm_mon)
+        r[6] = _bcd(t.tm_year - 2000)
+
+    def read(self, reg, n):
+        self._refresh()
+        return bytes(self.regs[reg:reg + n])
+
+    def write(self, reg, data):
+        self._refresh()
+        self.regs[reg:reg + len(data)] = data
+        if reg < 7:
+            r = self.regs
+            self._base = calendar.timegm((_dec(r[6]) + 2000, _dec(r[5]), _dec(r[4]),
+                                          _dec(r[2]), _dec(r[1]), _dec(r[0] & 0x7F)))
+            self._at = self.world.clock.seconds()
+
+
+# 文字 LCD (HD44780 を PCF8574 経由の 4 ビットで駆動, I2C 0x27)
+# P0=RS, P2=E, P3=バックライト, P4-P7=データ。E の立ち下がりでニブルを取り込む
+# 初期化のリセット (8 ビットのファンクションセット) から 4 ビットへの切替も追う
+class LcdModel:
+    _BARS = ' ▏▎▍▋█'
+
+    def __init__(self, world, columns=16, lines=2):
+        self.world = world
+        self.columns = columns
+        self.lines = lines
+        self.ddram = bytearray(b' ' * 128)
+        self.cgram = bytearray(64)
+        self.addr = 0
+        self.cg = False  # データの書き先が CGRAM
+        self.four_bit = False
+        self.backlight = False
+        self._nibble = None
+        self._e = 0
+        self.transfers = 0  # writeto の回数
+        self.bytes = 0  # バス上のバイト数
+        self.clears = 0
+        self.data_writes = 0  # 書き込まれた文字数
+
+    def write_raw(self, data):
+        self.transfers += 1
+        self.bytes += len(data)
+        for b in data:
+            self.backlight = bool(b & 0x08)
+            if self._e and not b & 0x04:
+                self._strobe(b >> 4, b & 0x01)
+            self._e = b & 0x04
+
+    def _strobe(self, nibble, rs):
+        if not self.four_bit:
+            self._command(nibble << 4)
+            return
+        if self._nibble is None:
+            self._nibble = nibble
+            return
+        v = self._nibble << 4 | nibble
+        self._nibble = None
+        if rs:
+            self.data_writes += 1
+            if self.cg:
+                self.cgram[self.addr & 0x3F] = v & 0x1F
+            else:
+                self.ddram[self.addr & 0x7F] = v
+            self.addr += 1
+        else:
+            self._command(v)
+
+    def _command(self, v):
+        if v & 0x80:
+            self.addr = v & 0x7F
+            self.cg = False
+        elif v & 0x40:
+            self.addr = v & 0x3F
+            self.cg = True
+        elif v & 0x20:
+            self.four_bit = not v & 0x10
+        elif v == 0x01:
+            self.ddram[:] = b' ' * 128
+            self.addr = 0
+            self.cg = False
+            self.clears += 1
+        elif v & 0xFE == 0x02:
+            self.addr = 0
+            self.cg = False
+
+    def _char(self, c):
+        if c < 8:
+            return self._BARS[min(5, bin(self.cgram[c * 8]).count('1'))]
+        return chr(c) if 0x20 <= c < 0x7F else '?'
+
+    # 表示中の各行 (CGRAM の文字は 1 行目の点の数で棒グラフの記号にする)
+    def text(self):
+        bases = (0x00, 0x40, self.columns, 0x40 + self.columns)
+        return [''.join(self._char(c) for c in self.ddram[bases[i]:bases[i] + self.columns])
+                for i in range(self.lines)]
+
+
+# フラッシュ: デバイス上の絶対パス '/x' をホストの root/x に対応させる
+class FlashFS:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, p):
+        if not p.startswith('/'):
+            p = '/' + p
+        return os.path.join(self.root, p.lstrip('/'))
+
+    def open(self, p, mode='r', *args, **kwargs):
+        if 'b' not in mode and 'encoding' not in kwargs:
+            kwargs['encoding'] = 'utf-8'
+        return open(self.path(p), mode, *args, **kwargs)
+
+
+class World:
+    def __init__(self, root, start=(2024, 6, 1, 0, 0, 0), level=None, stroke_sec=60.0,
+                 gate_position=1.0, rtc_drift_ppm=0.0, echo=False, lcd=True):
+        self.clock = VirtualClock()
+        self.fs = FlashFS(root)
+        self.loop = None
+        self.echo = echo
+        self.console = []
+        self.pins = {}
+        self.i2c_devices = {}
+        self.resets = 0
+        self._pending = []
+        # 内蔵 RTC (RTC().datetime() で設定) と DS1307 (UTC を保持)
+        self._wall_base = calendar.timegm(start)
+        self._wall_at = 0.0
+        self.ds1307 = DS1307Model(self, calendar.timegm(start) - 9 * 3600, rtc_drift_ppm)
+        self.i2c_devices[0x68] = self.ds1307
+        self.lcd = LcdModel(self) if lcd else None
+        if self.lcd:
+            self.i2c_devices[0x27] = self.lcd
+        self.level = level or ScriptedLevel([(0, 5.0)])
+        self.level.world = self
+        self.sonar = SonarModel(self, 15, 14, self.level)
+        self.gate = GateModel(self, 12, 13, stroke_sec, gate_position)
+        self.ble = None
+        self.central = None
+
+    def pin_state(self, pin_id):
+        s = self.pins.get(pin_id)
+        if s is None:
+            s = self.pins[pin_id] = PinState(self, pin_id)
+        return s
+
+    # 入力ピンを外から駆動する (スイッチを押す・離す)。起動前に呼べば押したまま起動した状態になる
+    def drive(self, pin_id, v):
+        s = self.pin_state(pin_id)
+        s.driven = True
+        s.set(v)
+
+    # 内蔵 RTC の時刻 (秒)
+    def wall_time(self):
+        return self._wall_base + (self.clock.seconds() - self._wall_at)
+
+    def set_wall_time(self, epoch):
+        self._wall_base = epoch
+        self._wall_at = self.clock.seconds()
+
+    def print(self, *args, sep=' ', end='\n', **kwargs):
+        line = sep.join(str(a) for a in args)
+        self.console.append((self.clock.seconds(), line))
+        if self.echo:
+            print(f"[{self.clock.seconds():10.3f}] {line}", end=end)
+
+    # 仮想時刻 t 秒に fn(*args) を実行する (ループ開始前なら開始時に登録)
+    def at(self, t, fn, *args):
+        if self.loop is None:
+            self._pending.append((t, fn, args))
+        else:
+            self.loop.call_at(t, fn, *args)
+
+    def call_later_us(self, us, fn, *args):
+        self.at(self.clock.seconds() + us / 1_000_000, fn, *args)
+
+    def attach_loop(self, loop):
+        self.loop = loop
+        pending, self._pending = self._pending, []
+        for t, fn, args in pending:
+            loop.call_at(t, fn, *args)
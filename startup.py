@@ -0,0 +1,33 @@
+# 起動の段階ごとの所要時間
+# main.py の読み込みを起点に、各段階の完了・最初の測定・最初のコマンドまでの時間 (ms) を記録する
+
+import utime
+
+
+class Startup:
+    def __init__(self):
+        self.t0 = utime.ticks_ms()
+        self.marks = []  # (段階, 起点からの ms)
+        self._names = set()
+
+    # 段階の完了を記録して起点からの ms を返す
+    def mark(self, name):
+        ms = utime.ticks_diff(utime.ticks_ms(), self.t0)
+        self.marks.append((name, ms))
+        self._names.add(name)
+        return ms
+
+    # 最初の 1 回だけ記録する (2 回目以降は None)
+    def once(self, name):
+        if name in self._names:
+            return None
+        return self.mark(name)
+
+    def get(self, name):
+        for n, ms in self.marks:
+            if n == name:
+                return ms
+        return None
+
+    def report(self):
+        return ' '.join(f"{n}={ms}ms" for n, ms in self.marks)
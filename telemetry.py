@@ -0,0 +1,104 @@
+# バイナリ状態フレーム
+# show_status() の文字列と同じ内容を固定長の struct で BLE の状態キャラクタリスティックに載せる
+# ホスト側のデコーダは tools/status_decoder.py (形式を変えたら STATUS_VERSION を上げて両方直す)
+
+import struct
+import utime
+
+STATUS_VERSION = 1
+# version, seq, 水位(0.1cm), 閾値(0.1cm), モード, 門, フラグ, 閉門待ち(秒), 稼働時間(秒)
+STATUS_FORMAT = '<BHhhBBBHI'
+STATUS_SIZE = struct.calcsize(STATUS_FORMAT)
+
+FLAG_DRIVE_TIMES = 0x01  # 運用時間帯
+
+MODE_CODES = {
+    None: 0,
+    'auto': 1,
+    'force': 2,
+    'log': 3,
+    'self': 4,
+    'menu': 5,
+    'configure': 6,
+    'test': 7,
+}
+
+
+def _int16(v):
+    return max(-32768, min(32767, int(round(v * 10))))
+
+
+class StatusFrame:
+    def __init__(self):
+        self.buf = bytearray(STATUS_SIZE)
+        self.seq = 0
+
+    def pack(self, level_cm, threshold_cm, mode, gate, drive_times, countdown_sec, uptime_sec):
+        self.seq = (self.seq + 1) & 0xFFFF
+        struct.pack_into(
+            STATUS_FORMAT, self.buf, 0,
+            STATUS_VERSION,
+            self.seq,
+            _int16(level_cm),
+            _int16(threshold_cm),
+            MODE_CODES.get(mode, 0),
+            gate,
+            FLAG_DRIVE_TIMES if drive_times else 0,
+            max(0, min(0xFFFF, int(countdown_sec))),
+            uptime_sec & 0xFFFFFFFF,
+        )
+        return self.buf
+
+
+# 広告に載せる状態 (接続せずに複数の装置を見るため。BLESimplePeripheral.set_adv_status)
+# 広告パケット: version, seq, 水位(0.1cm), 開度(%), 状態 (下位 4 ビット: モード | ADV_* フラグ)
+# スキャン応答: version, seq, 閾値(0.1cm), 閉門待ち(秒)
+# 内容が変わった時だけ seq を進めるので、変わらなければ広告も書き換わらない
+# デコーダは tools/status_decoder.py (形式を変えたら ADV_VERSION を上げて両方直す)
+ADV_VERSION = 1
+ADV_FORMAT = '<BBhBB'
+ADV_DETAIL_FORMAT = '<BBhH'
+
+ADV_GATE_CLOSED = 0x10
+ADV_DRIVE_TIMES = 0x20
+ADV_MOVING = 0x40
+
+
+class AdvStatus:
+    def __init__(self):
+        self.adv = bytearray(struct.calcsize(ADV_FORMAT))
+        self.detail = bytearray(struct.calcsize(ADV_DETAIL_FORMAT))
+        self._values = None
+        self.seq = 0
+
+    # 前回と値が違えば詰め直して True
+    def pack(self, level_cm, percent, mode, gate, drive_times, moving, threshold_cm, countdown_sec):
+        state = MODE_CODES.get(mode, 0) & 0x0F
+        if gate:
+            state |= ADV_GATE_CLOSED
+        if drive_times:
+            state |= ADV_DRIVE_TIMES
+        if moving:
+            state |= ADV_MOVING
+        values = (_int16(level_cm), max(0, min(255, int(percent))), state,
+                  _int16(threshold_cm), max(0, min(0xFFFF, int(countdown_sec))))
+        if values == self._values:
+            return False
+        self._values = values
+        self.seq = (self.seq + 1) & 0xFF
+        struct.pack_into(ADV_FORMAT, self.adv, 0, ADV_VERSION, self.seq, values[0], values[1], values[2])
+        struct.pack_into(ADV_DETAIL_FORMAT, self.detail, 0, ADV_VERSION, self.seq, values[3], values[4])
+        return True
+
+
+# 稼働時間 (秒)。ticks_ms の周回をまたいで数えるため半周期以内に update() を呼ぶこと
+class Uptime:
+    def __init__(self):
+        self._last = utime.ticks_ms()
+        self._ms = 0
+
+    def update(self):
+        now = utime.ticks_ms()
+        self._ms += utime.ticks_diff(now, self._last)
+        self._last = now
+        return self._ms // 1000
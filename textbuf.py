@@ -0,0 +1,79 @@
+# 事前確保したバッファへの文字列組み立て
+# 周期処理で f-string を作るとその都度ヒープを確保するため、数値や日時は桁ごとに直接書き込む
+# 定数の文字列は呼び出し側で bytes にしておく (str を渡すと encode の分だけ確保する)
+# view() は同じバッファを指すので、保持する側 (キューなど) がコピーすること
+
+_DIGITS = b'0123456789'
+
+
+class TextBuf:
+    def __init__(self, size=128):
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self.n = 0
+
+    def clear(self):
+        self.n = 0
+        return self
+
+    # bytes / bytearray / memoryview / str を追加する (溢れた分は捨てる)
+    def add(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        k = min(len(data), len(self._buf) - self.n)
+        self._mv[self.n:self.n + k] = data[:k] if k < len(data) else data
+        self.n += k
+        return self
+
+    def byte(self, c):
+        if self.n < len(self._buf):
+            self._buf[self.n] = c
+            self.n += 1
+        return self
+
+    # 整数 (width 桁に 0 埋め)
+    def int(self, v, width=0):
+        if v < 0:
+            self.byte(0x2D)
+            v = -v
+        v = int(v)
+        digits = 1
+        p = 10
+        while v >= p:
+            digits += 1
+            p *= 10
+        for _ in range(width - digits):
+            self.byte(0x30)
+        p //= 10
+        while p:
+            self.byte(_DIGITS[(v // p) % 10])
+            p //= 10
+        return self
+
+    # 小数 (decimals 桁で四捨五入)
+    def fixed(self, v, decimals=1):
+        scale = 10 ** decimals
+        if v < 0:
+            self.byte(0x2D)
+            v = -v
+        q = int(v * scale + 0.5)
+        self.int(q // scale)
+        if decimals:
+            self.byte(0x2E)
+            self.int(q % scale, decimals)
+        return self
+
+    # localtime() のタプルを YYYY/MM/DD HH:MM:SS で
+    def datetime(self, t):
+        self.int(t[0], 4).byte(0x2F).int(t[1], 2).byte(0x2F).int(t[2], 2).byte(0x20)
+        return self.hhmm(t).byte(0x3A).int(t[5], 2)
+
+    # HH:MM
+    def hhmm(self, t):
+        return self.int(t[3], 2).byte(0x3A).int(t[4], 2)
+
+    def view(self):
+        return self._mv[:self.n]
+
+    def __len__(self):
+        return self.n
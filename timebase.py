@@ -0,0 +1,143 @@
+# 単調な時刻と DS1307 への同期
+# 時刻は utime.ticks_ms() の基準点 (ticks, エポック ms) からの経過で求めるので、
+# asyncio の待ちの遅れや内蔵 RTC の設定で飛ばず、戻らない
+# (同期の補正で戻る分は HOLD_MS までなら時刻を止めて吸収する。起動時の設定など大きな補正はそのまま戻す)
+# DS1307 は UTC を保持する。現地時刻はエポック秒に tz_sec を足して localtime() で展開する
+# (手で時・日を繰り上げないので月末・年末も正しい)
+# 定期の同期は DS1307 の秒が変わる瞬間を待って行い、前回の同期からの ticks の進み遅れを drift_ppm に記録する
+# ticks_ms は約 12 日で一周するので、基準点は REANCHOR_MS ごとに進める
+
+import uasyncio as asyncio
+import utime
+from machine import RTC
+
+REANCHOR_MS = 3600 * 1000
+POLL_MS = 10  # 秒の変わり目を探す間隔
+EDGE_TIMEOUT_MS = 1500  # この間に秒が変わらなければ発振が止まっている
+HOLD_MS = 2000
+
+
+class TimeBase:
+    def __init__(self, rtc=None, tz_sec=0, resync_sec=3600):
+        self.rtc = rtc
+        self.tz_sec = tz_sec
+        self.resync_sec = resync_sec
+        self._ticks = utime.ticks_ms()
+        self._epoch_ms = utime.time() * 1000  # 同期するまでは内蔵 RTC の時刻
+        self._last = 0  # 最後に返した値 (戻らないようにする)
+        self._sync_ticks = None  # 前回の秒の変わり目で同期した ticks (None: まだ)
+        self.synced = False
+        self.syncs = 0
+        self.errors = 0
+        self.last_step_ms = 0  # 直前の同期で補正した量 (DS1307 - 自分)
+        self.drift_ppm = 0.0  # 直前の同期間隔での ticks の遅れ (正: ticks が遅い)
+        self.max_drift_ppm = 0.0
+
+    # 現地時刻のエポック ms
+    def now_ms(self):
+        t = utime.ticks_ms()
+        d = utime.ticks_diff(t, self._ticks)
+        if d >= REANCHOR_MS:
+            self._ticks = t
+            self._epoch_ms += d
+            d = 0
+        v = self._epoch_ms + d
+        if v < self._last:
+            return self._last
+        self._last = v
+        return v
+
+    def time(self):
+        return self.now_ms() // 1000
+
+    def localtime(self):
+        return utime.localtime(self.time())
+
+    # DS1307 の時刻 (現地のエポック秒)
+    def _read_rtc(self):
+        Y, M, D, _, h, m, s, _ = self.rtc.datetime()
+        return utime.mktime((Y, M, D, h, m, s, 0, 0)) + self.tz_sec
+
+    # ticks t の時点の時刻を epoch_ms にする。内蔵 RTC も合わせる
+    # exact: 秒の変わり目で読んだ値 (前回も exact なら間の進み遅れを記録する)
+    def _set(self, epoch_ms, t, exact):
+        step = epoch_ms - (self._epoch_ms + utime.ticks_diff(t, self._ticks))
+        if exact and self._sync_ticks is not None:
+            span = utime.ticks_diff(t, self._sync_ticks)
+            if span > 0:
+                self.drift_ppm = step * 1000000 / span
+                if abs(self.drift_ppm) > abs(self.max_drift_ppm):
+                    self.max_drift_ppm = self.drift_ppm
+        if step < -HOLD_MS:
+            self._last = 0
+        self._sync_ticks = t if exact else None
+        self._ticks = t
+        self._epoch_ms = epoch_ms
+        self.last_step_ms = step
+        self.synced = True
+        self.syncs += 1
+        lt = utime.localtime(epoch_ms // 1000)
+        RTC().datetime((lt[0], lt[1], lt[2], lt[6], lt[3], lt[4], lt[5], 0))
+
+    # 起動時の同期 (待たない。秒の中のどこかは分からないので中央とみなす)
+    def sync_now(self):
+        self._set(self._read_rtc() * 1000 + 500, utime.ticks_ms(), False)
+
+    # DS1307 の秒が変わる瞬間を待って同期する (最大 1 秒)。秒が変わらなければ False
+    async def sync(self):
+        s0 = self.rtc.datetime()[6]
+        start = prev = utime.ticks_ms()
+        while True:
+            await asyncio.sleep_ms(POLL_MS)
+            dt = self.rtc.datetime()
+            t = utime.ticks_ms()
+            if dt[6] != s0:
+                break
+            if utime.ticks_diff(t, start) > EDGE_TIMEOUT_MS:
+                self.errors += 1
+                return False
+            prev = t
+        # 変わり目は前回の読み出しと今回の間
+        edge = utime.ticks_add(prev, utime.ticks_diff(t, prev) // 2)
+        Y, M, D, _, h, m, s, _ = dt
+        self._set((utime.mktime((Y, M, D, h, m, s, 0, 0)) + self.tz_sec) * 1000, edge, True)
+        return True
+
+    # 定期同期のタスク
+    async def run(self):
+        while True:
+            try:
+                await self.sync()
+            except OSError:
+                self.errors += 1
+            await asyncio.sleep(self.resync_sec)
+
+
+# 絶対期限の周期実行
+# 前回の期限 + 周期まで眠るので、処理時間や起床の遅れが周期に積み重ならない
+# 周期を丸ごと逃した場合はその分を飛ばす (skipped)
+#
+#   tick = Periodic()
+#   tick.reset()
+#   while True:
+#       ...
+#       await asyncio.sleep_ms(tick.delay_ms(period_ms))
+class Periodic:
+    def __init__(self):
+        self._next = utime.ticks_ms()
+        self.skipped = 0
+
+    # 今を起点にする (タスクの開始時)
+    def reset(self):
+        self._next = utime.ticks_ms()
+
+    # 次の期限までの ms。period_ms は毎回渡す (設定の変更にそのまま追従する)
+    def delay_ms(self, period_ms):
+        now = utime.ticks_ms()
+        self._next = utime.ticks_add(self._next, period_ms)
+        late = utime.ticks_diff(now, self._next)
+        if late >= period_ms:
+            n = late // period_ms
+            self._next = utime.ticks_add(self._next, n * period_ms)
+            self.skipped += n
+        return max(0, utime.ticks_diff(self._next, now))
@@ -0,0 +1,136 @@
+# 水門装置のバイナリ状態フレームのデコーダ (ホスト側 / CPython)
+# 状態キャラクタリスティック (telemetry.py の StatusFrame) の値を辞書に戻す
+# 広告・スキャン応答の製造者固有フィールド (telemetry.py の AdvStatus) も読める
+#
+#   python tools/status_decoder.py 01 0c00...   (16 進文字列、空白可)
+#   python tools/status_decoder.py --adv <広告の 16 進> [<スキャン応答の 16 進>]
+
+import json
+import struct
+import sys
+
+# telemetry.py の STATUS_FORMAT と一致させる
+FORMATS = {
+    1: '<BHhhBBBHI',
+}
+
+MODE_NAMES = {
+    0: 'manual',
+    1: 'auto',
+    2: 'force',
+    3: 'log',
+    4: 'self',
+    5: 'menu',
+    6: 'configure',
+    7: 'test',
+}
+
+GATE_NAMES = {0: 'open', 1: 'close'}
+
+FLAG_DRIVE_TIMES = 0x01
+
+# telemetry.py の ADV_FORMAT / ADV_DETAIL_FORMAT と一致させる
+ADV_FORMATS = {
+    1: ('<BBhBB', '<BBhH'),
+}
+ADV_GATE_CLOSED = 0x10
+ADV_DRIVE_TIMES = 0x20
+ADV_MOVING = 0x40
+
+COMPANY_ID = 0xFFFF
+AD_TYPE_NAME = 0x09
+AD_TYPE_MANUFACTURER = 0xFF
+
+
+def decode_status(data):
+    data = bytes(data)
+    if not data:
+        raise ValueError('empty status frame')
+    fmt = FORMATS.get(data[0])
+    if fmt is None:
+        raise ValueError(f'unknown status frame version: {data[0]}')
+    size = struct.calcsize(fmt)
+    if len(data) < size:
+        raise ValueError(f'status frame too short: {len(data)} < {size}')
+    version, seq, level, threshold, mode, gate, flags, countdown, uptime = struct.unpack_from(fmt, data)
+    return {
+        'version': version,
+        'seq': seq,
+        'level_cm': level / 10,
+        'threshold_cm': threshold / 10,
+        'mode': MODE_NAMES.get(mode, mode),
+        'gate': GATE_NAMES.get(gate, gate),
+        'drive_times': bool(flags & FLAG_DRIVE_TIMES),
+        'countdown_sec': countdown,
+        'uptime_sec': uptime,
+    }
+
+
+def _adv_formats(data, kind):
+    data = bytes(data)
+    if len(data) < 2:
+        raise ValueError(f'{kind} record too short: {len(data)}')
+    fmts = ADV_FORMATS.get(data[0])
+    if fmts is None:
+        raise ValueError(f'unknown {kind} record version: {data[0]}')
+    return data, fmts
+
+
+# 広告パケットの状態 (製造者固有フィールドの会社 ID より後)
+def decode_adv_status(data):
+    data, fmts = _adv_formats(data, 'advertising')
+    version, seq, level, percent, state = struct.unpack_from(fmts[0], data)
+    return {
+        'version': version,
+        'seq': seq,
+        'level_cm': level / 10,
+        'percent': percent,
+        'mode': MODE_NAMES.get(state & 0x0F, state & 0x0F),
+        'gate': 'close' if state & ADV_GATE_CLOSED else 'open',
+        'drive_times': bool(state & ADV_DRIVE_TIMES),
+        'moving': bool(state & ADV_MOVING),
+    }
+
+
+# スキャン応答の状態
+def decode_adv_detail(data):
+    data, fmts = _adv_formats(data, 'scan response')
+    version, seq, threshold, countdown = struct.unpack_from(fmts[1], data)
+    return {'version': version, 'seq': seq, 'threshold_cm': threshold / 10, 'countdown_sec': countdown}
+
+
+# AD 構造の列から (種類, 値) を取り出す
+def decode_fields(payload):
+    payload = bytes(payload)
+    i = 0
+    while i + 1 < len(payload) and payload[i]:
+        yield payload[i + 1], payload[i + 2:i + 1 + payload[i]]
+        i += 1 + payload[i]
+
+
+# 広告とスキャン応答を 1 つの辞書にする (seq が違えば詳細は古いので含めない)
+def decode_advertising(adv, resp=b''):
+    result = {}
+    detail = None
+    for payload, is_resp in ((adv, False), (resp, True)):
+        for ad_type, value in decode_fields(payload):
+            if ad_type == AD_TYPE_NAME:
+                result['name'] = value.decode('utf-8', 'replace')
+            elif ad_type == AD_TYPE_MANUFACTURER and len(value) >= 2 and value[0] | value[1] << 8 == COMPANY_ID:
+                if is_resp:
+                    detail = decode_adv_detail(value[2:])
+                else:
+                    result.update(decode_adv_status(value[2:]))
+    if detail and detail['seq'] == result.get('seq'):
+        result['threshold_cm'] = detail['threshold_cm']
+        result['countdown_sec'] = detail['countdown_sec']
+    return result
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--adv']:
+        args = sys.argv[2:]
+        print(json.dumps(decode_advertising(bytes.fromhex(args[0]), bytes.fromhex(args[1]) if len(args) > 1 else b''),
+                         ensure_ascii=False))
+    else:
+        print(json.dumps(decode_status(bytes.fromhex(''.join(sys.argv[1:]))), ensure_ascii=False))